@@ -11,18 +11,65 @@
 # Option 1: Fill out the process_sequence() definition for each of the sequences. This will generate 2 views of the protein for each of the listed sequnces. The final sequence will remain visible in the pymol interface
 # Option 2: Copy and paste the entries for the process_sequence() definition one by one into the interface. This will generate and export the images, but will leave each structure visible.
 # Option 3: You can run each of the individual functions separately, but remember to clear_all_selections() between seperate sampels to reset labelled residues
-
-from pymol import cmd
+# Option 4: Run a whole manifest from the command line (see main() at the bottom of this file):
+#   pymol -cq Pymol_mark_mutations.py -- batch sequences.csv
+#   python Pymol_mark_mutations.py validate sequences.csv
+# Importing this module does no PyMOL work; pymol.cmd is only imported the first time it is used.
+# PyMOL's `run` (and `pymol -cq Pymol_mark_mutations.py`) executes this file in the `pymol` module namespace,
+# where __name__ is 'pymol', __file__ is PyMOL's own and __script__ is the path of this file.
+
+import importlib
 import os
+import sys
+import tempfile
+import time
+
+_SCRIPT_PATH = globals()['__script__'] if __name__ == 'pymol' and '__script__' in globals() else __file__
+_SCRIPT_DIR = os.path.dirname(os.path.abspath(_SCRIPT_PATH))
+
+# PyMOL does not put a script's directory on sys.path; the helper modules next to this file must be importable
+if _SCRIPT_DIR not in sys.path:
+    sys.path.insert(0, _SCRIPT_DIR)
+
+# What `from Pymol_mark_mutations import *` loads into PyMOL: the functions and settings, not the cmd proxy
+# (not set when running in the `pymol` namespace, whose own __all__ this would replace)
+if __name__ != 'pymol':
+    __all__ = [
+        'DEFAULT_OUTPUT_LOCATION', 'DEFAULT_SESSION_LOCATION', 'DEFAULT_COLOR', 'DEFAULT_MUTATION_COLOR', 'VIEWS',
+        'DEFAULT_OUTPUT_ARCHIVE', 'cif_file_path_H1', 'cif_file_path_H3', 'CLADE_RESIDUES', 'SUBCLADE_RESIDUES',
+        'clear_all_selections', 'set_base', 'set_antigenic_sites', 'set_clade_subclade', 'assess_mutations_HA',
+        'generate_image', 'save_pymol_session', 'load_structure', 'apply_style', 'open_tile_renderer', 'export_images',
+        'process_sequence',
+        'MANIFEST_FIELDS', 'NUMBERING_SCHEMES', 'parse_mutations', 'load_manifest', 'validate_record', 'validate_records',
+        'translate_records', 'COMMANDS', 'build_parser', 'main',
+    ]
 
 # Constants 
-DEFAULT_OUTPUT_LOCATION = os.path.join(os.path.dirname(__file__), 'Code_output', 'Images')
-DEFAULT_SESSION_LOCATION = os.path.join(os.path.dirname(__file__), 'Code_output', 'Sessions')
+DEFAULT_OUTPUT_LOCATION = os.path.join(_SCRIPT_DIR, 'Code_output', 'Images')
+DEFAULT_SESSION_LOCATION = os.path.join(_SCRIPT_DIR, 'Code_output', 'Sessions')
 DEFAULT_COLOR = 'grey70'
+DEFAULT_MUTATION_COLOR = 'grey20'
+VIEWS = ('side', 'top')
+# Set to a file path (e.g. Code_output/outputs.pack) to append images and sessions to one archive instead (see output_archive.py)
+DEFAULT_OUTPUT_ARCHIVE = None
 
 # Define the paths for the cif files based on strain type
-cif_file_path_H1 = os.path.join(os.path.dirname(__file__), 'ASL_pymol_updated', 'Structure_files', '4lxv-assembly1.cif')
-cif_file_path_H3 = os.path.join(os.path.dirname(__file__), 'ASL_pymol_updated', 'Structure_files', '4o5n-assembly1.cif')
+cif_file_path_H1 = os.path.join(_SCRIPT_DIR, 'Structure_files', '4lxv-assembly1.cif')
+cif_file_path_H3 = os.path.join(_SCRIPT_DIR, 'Structure_files', '4o5n-assembly1.cif')
+
+class _LazyCmd:
+    """Stand-in for pymol.cmd that imports PyMOL the first time a command is used."""
+    _module = None
+
+    def __getattr__(self, name):
+        if _LazyCmd._module is None:
+            # Through sys.modules, not `from pymol import cmd`: that attribute may be this proxy (see below)
+            _LazyCmd._module = importlib.import_module('pymol.cmd')
+        return getattr(_LazyCmd._module, name)
+
+# Inside PyMOL the real module is already loaded; in the `pymol` namespace this assignment replaces pymol.cmd,
+# so it must never be the proxy there
+cmd = sys.modules['pymol.cmd'] if 'pymol.cmd' in sys.modules else _LazyCmd()
 
 # ---------------------------------------------------
 # Initialization and Setup Functions
@@ -100,74 +147,78 @@ def set_antigenic_sites(strain_type):
         cmd.show('surface', site)
         cmd.set('surface_color', site, site)
 
-def set_clade_subclade(strain_type, clade_name, subclade_name=None):
-    print(f"Debug: strain_type={strain_type}, clade_name={clade_name}, subclade_name={subclade_name}")
-
-    if subclade_name and not subclade_name.startswith("Subclade_"):
-        subclade_name = f"Subclade_{subclade_name}"
-    print(f"Constructed subclade_name: {subclade_name}")
-
-    clade_residues = {
-        'H1N1': {
-            '5a.2': {'A+C+E': '74+97+129+162+163+164+185+216+256+295','B+D+F':'124'},
-            '5a.2a': {'A+C+E': '54+129+156+161+185+186+189+308'},
-            '5a.2a.1': {'A+C+E': '54+129+137+142+156+161+185+186+189+308'}
+# Clade- and subclade-defining residues per strain type, keyed by chain group
+CLADE_RESIDUES = {
+    'H1N1': {
+        '5a.2': {'A+C+E': '74+97+129+162+163+164+185+216+256+295','B+D+F':'124'},
+        '5a.2a': {'A+C+E': '54+129+156+161+185+186+189+308'},
+        '5a.2a.1': {'A+C+E': '54+129+137+142+156+161+185+186+189+308'}
+    },
+    'H3N2': {
+        '2a.1':{
+            'A+A-2+A-3': '3+45+48+53+62+83+94+104+121+131+142+144+159+159+160+164+171+186+190+193+195+276+311',
+            'B+B-2+B-3': '77+155+160+103+200'
         },
-        'H3N2': {
-            '2a.1':{
-                'A+A-2+A-3': '3+45+48+53+62+83+94+104+121+131+142+144+159+159+160+164+171+186+190+193+195+276+311',
-                'B+B-2+B-3': '77+155+160+103+200'
-            },
-            '2a.1b':{
-                'A+A-2+A-3': '45+48+3+144+159+160+121+171+62+142+311+131+83+94+164+186+190+193+195+156+53+104+276+140+299',
-                'B+B-2+B-3': '160+77+155+200+193'
-            },
-            '2b':{
-                'A+A-2+A-3': '45+48+3+144+159+160+121+171+62+142+311+131+83+94+164+186+190+193+195+50+79+140',
-                'B+B-2+B-3': '160+77+155+200+193'
-            }
+        '2a.1b':{
+            'A+A-2+A-3': '45+48+3+144+159+160+121+171+62+142+311+131+83+94+164+186+190+193+195+156+53+104+276+140+299',
+            'B+B-2+B-3': '160+77+155+200+193'
+        },
+        '2b':{
+            'A+A-2+A-3': '45+48+3+144+159+160+121+171+62+142+311+131+83+94+164+186+190+193+195+50+79+140',
+            'B+B-2+B-3': '160+77+155+200+193'
         }
     }
-    
-    subclade_residues = {
-        'H3N2': {
-            '2a.1': {
-                'Subclade_G.1.1': {
-                    'A+A-2+A-3': '159+160+164+186+190+193+195+156+53+104+276'
-                }
-            },
-            '2a.1b': {
-                'Subclade_G.1.1.2': {
-                    'A+A-2+A-3': '159+160+164+186+190+193+195+156+53+104+276+140+299'
-                }
-            },
-            '2b': {
-                'Subclade_G.2': {
-                    'A+A-2+A-3': '159+160+164+186+190+193+195+50+79+140'
-                },
-                'Subclade_G.2.1': {
-                    'A+A-2+A-3': '159+160+164+186+190+193+195+50+79+140+135+262'
-                }
+}
+
+SUBCLADE_RESIDUES = {
+    'H3N2': {
+        '2a.1': {
+            'Subclade_G.1.1': {
+                'A+A-2+A-3': '159+160+164+186+190+193+195+156+53+104+276'
             }
         },
-        'H1N1': {
-            '5a.2': {
-                'Subclade_C': {'A+C+E': '156+161'}
-            },
-            '5a.2a': {
-                'Subclade_C.1': {'A+C+E': '54+186+189+308'},
-                'Subclade_C.1.8': {'A+C+E': '54+186+189+308+120+47'},
-                'Subclade_C.1.9': {'A+C+E': '54+186+189+308+120+169'}
+        '2a.1b': {
+            'Subclade_G.1.1.2': {
+                'A+A-2+A-3': '159+160+164+186+190+193+195+156+53+104+276+140+299'
+            }
+        },
+        '2b': {
+            'Subclade_G.2': {
+                'A+A-2+A-3': '159+160+164+186+190+193+195+50+79+140'
             },
-            '5a.2a.1': {
-                'Subclade_C.1.1': {'A+C+E': '137+142'},
-                'Subclade_D': {'A+C+E': '54+186+189+308+216'},
-                'Subclade_D.1': {'A+C+E': '54+186+189+308+45+216'},
-                'Subclade_D.2': {'A+C+E': '54+186+189+308+113+216'},
-                'Subclade_D.3': {'A+C+E': '54+186+189+308+120', 'B+D+F': '45'}
+            'Subclade_G.2.1': {
+                'A+A-2+A-3': '159+160+164+186+190+193+195+50+79+140+135+262'
             }
         }
+    },
+    'H1N1': {
+        '5a.2': {
+            'Subclade_C': {'A+C+E': '156+161'}
+        },
+        '5a.2a': {
+            'Subclade_C.1': {'A+C+E': '54+186+189+308'},
+            'Subclade_C.1.8': {'A+C+E': '54+186+189+308+120+47'},
+            'Subclade_C.1.9': {'A+C+E': '54+186+189+308+120+169'}
+        },
+        '5a.2a.1': {
+            'Subclade_C.1.1': {'A+C+E': '137+142'},
+            'Subclade_D': {'A+C+E': '54+186+189+308+216'},
+            'Subclade_D.1': {'A+C+E': '54+186+189+308+45+216'},
+            'Subclade_D.2': {'A+C+E': '54+186+189+308+113+216'},
+            'Subclade_D.3': {'A+C+E': '54+186+189+308+120', 'B+D+F': '45'}
+        }
     }
+}
+
+def set_clade_subclade(strain_type, clade_name, subclade_name=None):
+    print(f"Debug: strain_type={strain_type}, clade_name={clade_name}, subclade_name={subclade_name}")
+
+    if subclade_name and not subclade_name.startswith("Subclade_"):
+        subclade_name = f"Subclade_{subclade_name}"
+    print(f"Constructed subclade_name: {subclade_name}")
+
+    clade_residues = CLADE_RESIDUES
+    subclade_residues = SUBCLADE_RESIDUES
 
     # Check if the clade name exists
     if clade_name not in clade_residues[strain_type]:
@@ -194,7 +245,7 @@ def set_clade_subclade(strain_type, clade_name, subclade_name=None):
             print(f"Subclade {subclade_name} does not match clade {clade_name}.")
 
         
-def assess_mutations_HA(seq_name, H1_mutations=None, H2_mutations=None, color='grey20'):
+def assess_mutations_HA(seq_name, H1_mutations=None, H2_mutations=None, color=DEFAULT_MUTATION_COLOR):
     """Assess and display mutations for HA protein chains under the same selection name."""
     selection_string = ""
     if H1_mutations:
@@ -216,10 +267,19 @@ def assess_mutations_HA(seq_name, H1_mutations=None, H2_mutations=None, color='g
 # Image Export
 # ---------------------------------------------------
 
-def generate_image(seq_name, view, protein, clade, subclade, output_location=None):
-    """Generate an image with the specified view and save it to the output location."""
+def generate_image(seq_name, view, protein, clade, subclade, output_location=None, tiles=None, output_archive=None,
+                   orthoscopic=False, tile_renderer=None):
+    """Generate an image with the specified view and save it to the output location.
+
+    If tiles is given, the image is ray traced as that many strips in parallel worker processes (see tiled_render.py).
+    Tiles are always orthoscopic; orthoscopic=True gives an untiled image the same projection. tile_renderer is an
+    open TiledRenderer whose tile workers are reused (see export_images()).
+    If output_archive is given, the image is appended to that archive instead of written to output_location.
+    """
     if output_location is None:
         output_location = DEFAULT_OUTPUT_LOCATION
+    if output_archive is None:
+        output_archive = DEFAULT_OUTPUT_ARCHIVE
 
     print(f"The protein is defiend as {protein}")
 
@@ -263,9 +323,12 @@ def generate_image(seq_name, view, protein, clade, subclade, output_location=Non
                 346.461273193,  480.010101318,  -20.000000000
             ])
     
-    # Create the subdirectory for the protein if it doesn't exist
-    protein_path = os.path.join(output_location, protein)
-    os.makedirs(protein_path, exist_ok=True)
+    # Create the subdirectory for the protein if it doesn't exist (archived images go through a scratch directory)
+    if output_archive:
+        protein_path = tempfile.mkdtemp(prefix='pymol_image_')
+    else:
+        protein_path = os.path.join(output_location, protein)
+        os.makedirs(protein_path, exist_ok=True)
     
    # Generate the filename based on provided arguments
     # Corrected code snippet for filename generation:
@@ -283,29 +346,53 @@ def generate_image(seq_name, view, protein, clade, subclade, output_location=Non
     
     # Clear selections to avoid showing selection dots in the image
     cmd.deselect()
-    
-    # Aggressively zoom in on the visible structure to reduce white space
-    cmd.zoom('visible', buffer=0)  # Tight zoom
-    
-    # Further adjust clipping planes to reduce white space
-    cmd.clip('near', -5)  # Adjust near clipping plane
-    cmd.clip('far', 5)    # Adjust far clipping plane
-    
-    # Save the image with high DPI
-    cmd.png(full_path, dpi=300)
-    print(f"Image saved to: {full_path}")
+
+    # The views above are perspective; tiled strips can only be ray traced orthoscopic. The projection is put back
+    # afterwards so that saved sessions and later renders keep their own.
+    previous_orthoscopic = cmd.get('orthoscopic')
+    if tiles or orthoscopic:
+        cmd.set('orthoscopic', 1)
+    try:
+        # Aggressively zoom in on the visible structure to reduce white space
+        cmd.zoom('visible', buffer=0)  # Tight zoom
+
+        # Further adjust clipping planes to reduce white space
+        cmd.clip('near', -5)  # Adjust near clipping plane
+        cmd.clip('far', 5)    # Adjust far clipping plane
+
+        # Save the image with high DPI
+        if tiles and tile_renderer:
+            tile_renderer.render(full_path, dpi=300)
+        elif tiles:
+            from tiled_render import render_tiled
+            render_tiled(full_path, tiles=tiles, dpi=300)
+        else:
+            cmd.png(full_path, dpi=300)
+    finally:
+        cmd.set('orthoscopic', previous_orthoscopic)
+
+    if output_archive:
+        _archive_output(output_archive, f"Images/{protein}/{filename}", full_path,
+                        seq_name=seq_name, view=view, kind='image', protein=protein)
+    else:
+        print(f"Image saved to: {full_path}")
 
 # Example usage:
 # generate_image(seq_name='AAID1', view='side', protein='H1', clade='5a.2a', subclade='C.1.9')
 
-def save_pymol_session(seq_name, clade, subclade, protein, output_location=None):
+def save_pymol_session(seq_name, clade, subclade, protein, output_location=None, output_archive=None):
     """Save the current PyMOL session to a .pse file."""
     if output_location is None:
         output_location = DEFAULT_SESSION_LOCATION
+    if output_archive is None:
+        output_archive = DEFAULT_OUTPUT_ARCHIVE
 
-    # Create the subdirectory for the protein if it doesn't exist
-    session_path = os.path.join(output_location, protein)
-    os.makedirs(session_path, exist_ok=True)
+    # Create the subdirectory for the protein if it doesn't exist (archived sessions go through a scratch directory)
+    if output_archive:
+        session_path = tempfile.mkdtemp(prefix='pymol_session_')
+    else:
+        session_path = os.path.join(output_location, protein)
+        os.makedirs(session_path, exist_ok=True)
 
     # Generate the session filename
     filename_parts = [seq_name] if seq_name else []
@@ -320,40 +407,412 @@ def save_pymol_session(seq_name, clade, subclade, protein, output_location=None)
 
     # Save the session
     cmd.save(full_path)
-    print(f"Session saved to: {full_path}")
 
-def process_sequence(seq_name, cif_file_path, strain_type, clade, subclade, H1_mutations, H2_mutations, color='grey20'):
-    """Process a sequence by setting up the base, assessing mutations, and generating images."""
-    
-    # Clear prior functions
-    clear_all_selections()
-    
-    # Automatically select cif_file_path based on strain_type
+    if output_archive:
+        _archive_output(output_archive, f"Sessions/{protein}/{filename}", full_path,
+                        seq_name=seq_name, kind='session', protein=protein)
+    else:
+        print(f"Session saved to: {full_path}")
+
+def _archive_output(output_archive, name, full_path, **metadata):
+    """Move a freshly written output file from its scratch directory into the output archive."""
+    from output_archive import append_file
+
+    cmd.sync()
+    append_file(output_archive, name, full_path, **metadata)
+    os.rmdir(os.path.dirname(full_path))
+    print(f"Saved to: {output_archive} ({name})")
+
+# ---------------------------------------------------
+# Pipeline Stages
+# ---------------------------------------------------
+
+# process_sequence() and the batch scheduler (job_scheduler.py) both run a sequence through these stages, so a
+# scheduled batch renders exactly what process_sequence() renders
+
+def load_structure(strain_type, cif_file_path=None):
+    """Clear the scene and load the strain's structure (the bundled cif file if no path is given); returns the protein."""
     if strain_type == 'H1N1':
-        cif_file_path = cif_file_path_H1
+        cif_file_path = cif_file_path or cif_file_path_H1
         protein = 'H1'
     elif strain_type == 'H3N2':
-        cif_file_path = cif_file_path_H3
+        cif_file_path = cif_file_path or cif_file_path_H3
         protein = 'H3'
     else:
         raise ValueError(f"Unknown strain type: {strain_type}. Please use 'H1N1' or 'H3N2'.")
 
-e ValueError(f"Unknown strain type: {strain_type}. Please use 'H1N1' or 'H3N2'.")
-
-    # Set up the base environment
+    clear_all_selections()
     set_base(cif_file_path)
+    return protein
+
+def apply_style(strain_type, clade, subclade):
+    """Color the antigenic sites and the clade- and subclade-defining residues."""
     set_antigenic_sites(strain_type)
     set_clade_subclade(strain_type, clade, subclade)
+
+def open_tile_renderer(tiles):
+    """Context manager with one pool of tile workers for every view of the current scene (None if not tiled)."""
+    if not tiles:
+        from contextlib import nullcontext
+        return nullcontext()
+    from tiled_render import TiledRenderer
+    return TiledRenderer(tiles=tiles)
+
+def export_images(seq_name, protein, clade, subclade, views=VIEWS, output_location=None, tiles=None, output_archive=None,
+                  renderer=None):
+    """Render the current scene from each view; tiled views share one pool of tile workers unless renderer is given."""
+    if tiles and renderer is None:
+        with open_tile_renderer(tiles) as renderer:
+            return export_images(seq_name, protein, clade, subclade, views=views, output_location=output_location,
+                                 tiles=tiles, output_archive=output_archive, renderer=renderer)
+    for view in views:
+        generate_image(seq_name=seq_name, view=view, protein=protein, clade=clade, subclade=subclade,
+                       output_location=output_location, tiles=tiles, output_archive=output_archive,
+                       tile_renderer=renderer)
+
+def process_sequence(seq_name, cif_file_path, strain_type, clade, subclade, H1_mutations, H2_mutations,
+                     color=DEFAULT_MUTATION_COLOR, output_location=None, session_location=None, save_session=True,
+                     tiles=None, numbering=None, output_archive=None, timings=None):
+    """Process a sequence by setting up the base, assessing mutations, and generating images.
+
+    Mutations are taken as the structure's own residue numbering unless numbering names another scheme
+    ('mature', 'full_length' or 'H3', see numbering.py). If timings is a dict, the seconds spent in each stage are
+    appended to it under job_scheduler.stage_key(), ready for job_scheduler.record_timings().
+    """
+
+    def timed(stage, function, *args, view=None, **kwargs):
+        if timings is None:
+            return function(*args, **kwargs)
+        from job_scheduler import PROTEINS, stage_key
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        key = stage_key(stage, PROTEINS[strain_type], view, tiles if stage == 'render' else None)
+        timings.setdefault(key, []).append(time.perf_counter() - start)
+        return result
     
-    # Assess mutations and generate images
-    assess_mutations_HA(seq_name, H1_mutations, H2_mutations, color=color)
-    generate_image(seq_name=seq_name, view='side', protein=protein, clade=clade, subclade=subclade)
-    generate_image(seq_name=seq_name, view='top', protein=protein, clade=clade, subclade=subclade)
+    # Clear prior functions and set up the base environment for the strain's structure
+    protein = timed('load', load_structure, strain_type, cif_file_path)
+
+    # Translate the mutation positions into the structure's author numbering
+    if numbering and numbering != 'pdb':
+        from numbering import STRAIN_STRUCTURES, translate
+        structure = STRAIN_STRUCTURES[strain_type]
+        H1_mutations = translate(structure, 'H1', H1_mutations or [], numbering)
+        H2_mutations = translate(structure, 'H2', H2_mutations or [], numbering)
+
+    timed('style', apply_style, strain_type, clade, subclade)
+    
+    # Assess mutations and generate images, timing every view on its own
+    timed('mutation', assess_mutations_HA, seq_name, H1_mutations, H2_mutations, color=color)
+    with open_tile_renderer(tiles) as renderer:
+        for view in VIEWS:
+            timed('render', export_images, seq_name, protein, clade, subclade, views=(view,), view=view,
+                  output_location=output_location, tiles=tiles, output_archive=output_archive, renderer=renderer)
 
     # Save the PyMOL session
-    save_pymol_session(seq_name=seq_name, clade=clade, subclade=subclade, protein=protein)
+    if save_session:
+        timed('session', save_pymol_session, seq_name=seq_name, clade=clade, subclade=subclade, protein=protein,
+              output_location=session_location, output_archive=output_archive)
 
-print("Loaded Functions")
+# ---------------------------------------------------
+# Manifests
+# ---------------------------------------------------
+
+MANIFEST_FIELDS = ['seq_name', 'strain_type', 'clade', 'subclade', 'H1_mutations', 'H2_mutations']
+
+# Numbering schemes accepted in a manifest's numbering column (see numbering.SCHEMES)
+NUMBERING_SCHEMES = ('pdb', 'mature', 'full_length', 'H3')
+
+def parse_mutations(value):
+    """Parse a mutation list written as '50 242', '50;242', '50+242' or '[50, 242]' into integers."""
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple)):
+        return [int(v) for v in value]
+    for separator in '[],;+':
+        value = value.replace(separator, ' ')
+    return [int(v) for v in value.split()]
+
+def load_manifest(manifest_path, numbering=None):
+    """Load sequences to process from a .csv (one row per sequence) or .json (list of objects) manifest.
+
+    numbering is the scheme of rows without a numbering column of their own.
+    """
+    if manifest_path.endswith('.json'):
+        import json
+        with open(manifest_path) as handle:
+            rows = json.load(handle)
+    else:
+        import csv
+        with open(manifest_path, newline='') as handle:
+            rows = list(csv.DictReader(handle))
+
+    records = []
+    for row in rows:
+        record = {field: row.get(field) for field in MANIFEST_FIELDS}
+        record['subclade'] = record['subclade'] or None
+        for key in ('H1_mutations', 'H2_mutations'):
+            try:
+                record[key] = parse_mutations(record[key])
+            except (TypeError, ValueError):
+                # Reported by validate_record(), so one bad row does not stop the whole manifest
+                record.setdefault('problems', []).append(f"{key} {record[key]!r} is not a list of residue numbers")
+                record[key] = []
+        if row.get('color'):
+            record['color'] = row['color']
+        if row.get('numbering') or numbering:
+            record['numbering'] = row.get('numbering') or numbering
+        records.append(record)
+    return records
+
+def validate_record(record):
+    """Return a list of problems with one manifest record (an empty list means it can be processed).
+
+    Only the name of a numbering scheme is checked here; validate_records() also checks that every position
+    exists in the structure, for a whole manifest at once.
+    """
+    problems = list(record.get('problems') or [])
+    strain_type = record.get('strain_type')
+    clade = record.get('clade')
+    subclade = record.get('subclade')
+    if not record.get('seq_name'):
+        problems.append("missing seq_name")
+    if strain_type not in CLADE_RESIDUES:
+        problems.append(f"unknown strain type {strain_type!r}; use 'H1N1' or 'H3N2'")
+        return problems
+    if clade not in CLADE_RESIDUES[strain_type]:
+        problems.append(f"clade {clade!r} not recognized for {strain_type}")
+    elif subclade:
+        subclade_name = subclade if subclade.startswith("Subclade_") else f"Subclade_{subclade}"
+        if subclade_name not in SUBCLADE_RESIDUES[strain_type].get(clade, {}):
+            problems.append(f"subclade {subclade!r} does not match clade {clade!r}")
+    for key in ('H1_mutations', 'H2_mutations'):
+        if any(position <= 0 for position in record.get(key) or []):
+            problems.append(f"{key} must be positive residue numbers")
+    numbering = record.get('numbering')
+    if numbering and numbering not in NUMBERING_SCHEMES:
+        problems.append(f"unknown numbering {numbering!r}; use one of {', '.join(NUMBERING_SCHEMES)}")
+    return problems
+
+def validate_records(records):
+    """Return the list of problems of every manifest record, checking positions against the structures in bulk.
+
+    Positions must exist in the structure, after translation for records in another numbering scheme.
+    """
+    problems = [validate_record(record) for record in records]
+    schemes = {record.get('numbering') or 'pdb' for record, own in zip(records, problems) if not own}
+    if schemes:
+        from numbering import STRAIN_STRUCTURES, untranslatable_positions
+        for scheme in schemes:
+            positions = [i for i, record in enumerate(records)
+                         if (record.get('numbering') or 'pdb') == scheme and not problems[i]]
+            for i, missing in zip(positions, untranslatable_positions([records[i] for i in positions], scheme)):
+                for group, values in missing.items():
+                    problems[i].append(f"{group} positions {values} in {scheme} numbering have no residue in "
+                                       f"{STRAIN_STRUCTURES[records[i]['strain_type']]}")
+    return problems
+
+def translate_records(records):
+    """Translate every record with a 'numbering' field into structure numbering, in bulk per numbering scheme."""
+    schemes = {record.get('numbering') for record in records} - {None, '', 'pdb'}
+    if not schemes:
+        return records
+
+    from numbering import translate_manifest
+    translated = list(records)
+    for scheme in schemes:
+        positions = [i for i, record in enumerate(records) if record.get('numbering') == scheme]
+        for i, record in zip(positions, translate_manifest([records[i] for i in positions], source=scheme)):
+            record['numbering'] = None
+            translated[i] = record
+    return translated
+
+# ---------------------------------------------------
+# Command Line
+# ---------------------------------------------------
+
+def _command_validate(args):
+    records = load_manifest(args.manifest, numbering=args.numbering)
+    failures = 0
+    for record, problems in zip(records, validate_records(records)):
+        if problems:
+            failures += 1
+            print(f"{record.get('seq_name') or '<unnamed>'}: " + "; ".join(problems))
+    print(f"{len(records) - failures}/{len(records)} sequences valid.")
+    return 1 if failures else 0
+
+def _valid_records(records):
+    """Split off the records that cannot be processed, printing why; returns (valid records, number skipped)."""
+    valid = []
+    for record, problems in zip(records, validate_records(records)):
+        if problems:
+            print(f"Skipping {record.get('seq_name') or '<unnamed>'}: " + "; ".join(problems))
+            continue
+        valid.append(record)
+    return valid, len(records) - len(valid)
+
+def _command_batch(args):
+    records, skipped = _valid_records(load_manifest(args.manifest, numbering=args.numbering))
+    records = translate_records(records)
+    status = 1 if skipped else 0
+    if not records:
+        print("No valid sequences to process.")
+        return status
+
+    # Plan the batch from recorded timings and run it on several workers (see job_scheduler.py)
+    if args.workers or args.dry_run:
+        from job_scheduler import format_plan, plan_batch, run_plan
+        cif_file_paths = {'H1N1': cif_file_path_H1, 'H3N2': cif_file_path_H3}
+        plan = plan_batch(records, cif_file_paths, workers=args.workers or 1, save_session=not args.no_session,
+                          tiles=args.tiles)
+        print(format_plan(plan, records))
+        if not args.dry_run:
+            run_plan(plan, save_session=not args.no_session, tiles=args.tiles, output_location=args.output_location,
+                     session_location=args.session_location, output_archive=args.archive)
+        return status
+
+    # One sequence after another, recording stage timings for later plans
+    from job_scheduler import record_timings
+    samples = {}
+    for record in records:
+        process_sequence(cif_file_path=None, output_location=args.output_location,
+                         session_location=args.session_location, save_session=not args.no_session,
+                         tiles=args.tiles, output_archive=args.archive, timings=samples, **record)
+    record_timings(samples)
+    return status
+
+def _command_render_one(args):
+    record = {
+        'seq_name': args.seq_name,
+        'strain_type': args.strain_type,
+        'clade': args.clade,
+        'subclade': args.subclade,
+        'H1_mutations': parse_mutations(args.H1_mutations),
+        'H2_mutations': parse_mutations(args.H2_mutations),
+        'numbering': args.numbering,
+    }
+    problems = validate_records([record])[0]
+    if problems:
+        print("; ".join(problems))
+        return 1
+    process_sequence(cif_file_path=args.cif_file_path, color=args.color, output_location=args.output_location,
+                     session_location=args.session_location, save_session=not args.no_session,
+                     tiles=args.tiles, output_archive=args.archive, **record)
+    return 0
+
+def _command_analyze(args):
+    from cohort import Cohort
+
+    if args.min_frequency is not None and not 0 < args.min_frequency <= 1:
+        print(f"--min-frequency must be above 0 and at most 1, got {args.min_frequency}.")
+        return 1
+
+    # Positions are compared in each structure's own numbering, one cohort per strain type
+    records, skipped = _valid_records(load_manifest(args.manifest, numbering=args.numbering))
+    by_strain_type = {}
+    for record in translate_records(records):
+        by_strain_type.setdefault(record['strain_type'], []).append(record)
+    if args.reference and not any(record['seq_name'] == args.reference for record in records):
+        print(f"Reference {args.reference} is not in the manifest.")
+        return 1
+
+    for strain_type, strain_records in sorted(by_strain_type.items()):
+        cohort = Cohort.from_records(strain_records, strain_type)
+        print(f"{strain_type}: {len(cohort)} sequences")
+        summary = [('union', cohort.union()), ('intersection', cohort.intersection())]
+        if args.min_frequency is not None:
+            summary.append((f'frequency >= {args.min_frequency}', cohort.at_least(args.min_frequency)))
+        if args.reference in cohort.seq_names:
+            reference = cohort.sequence(args.reference)
+            summary.append((f'shared with {args.reference}', cohort.union() & reference))
+            summary.append((f'not in {args.reference}', cohort.union() - reference))
+        elif args.reference:
+            print(f"  ({args.reference} is not {strain_type}; not compared)")
+        for label, residue_set in summary:
+            print(f"  {label}: H1_mutations={residue_set.H1_mutations} H2_mutations={residue_set.H2_mutations}")
+    return 1 if skipped else 0
+
+COMMANDS = {
+    'batch': _command_batch,
+    'validate': _command_validate,
+    'render-one': _command_render_one,
+    'analyze': _command_analyze,
+}
+
+def build_parser():
+    """Build the argument parser for the command line entry point."""
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='Pymol_mark_mutations', description="Mark HA mutations and export PyMOL images.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    def add_numbering_option(subparser, rows=False):
+        scope = " in rows without a numbering column" if rows else ""
+        subparser.add_argument('--numbering', default=None, choices=NUMBERING_SCHEMES,
+                               help=f"Numbering scheme of the mutation positions{scope} (default: the structure's own numbering)")
+
+    def add_output_options(subparser):
+        subparser.add_argument('--output-location', default=None, help="Image directory (default: Code_output/Images)")
+        subparser.add_argument('--session-location', default=None, help="Session directory (default: Code_output/Sessions)")
+        subparser.add_argument('--no-session', action='store_true', help="Do not save a .pse session")
+        subparser.add_argument('--archive', default=None,
+                               help="Append images and sessions to this single archive file instead (see output_archive.py)")
+        subparser.add_argument('--tiles', type=int, default=None,
+                               help="Ray trace each image as this many strips in parallel worker processes")
+
+    batch = subparsers.add_parser('batch', help="Render every sequence in a manifest")
+    batch.add_argument('manifest', help="CSV or JSON manifest with columns " + ", ".join(MANIFEST_FIELDS)
+                       + " and optional color and numbering")
+    add_numbering_option(batch, rows=True)
+    add_output_options(batch)
+    batch.add_argument('--workers', type=int, default=None,
+                       help="Plan the batch from recorded timings and run it on this many worker processes")
+    batch.add_argument('--dry-run', action='store_true', help="Print the plan and predicted wall time without rendering")
+
+    validate = subparsers.add_parser('validate', help="Check a manifest without starting PyMOL")
+    validate.add_argument('manifest')
+    add_numbering_option(validate, rows=True)
+
+    render_one = subparsers.add_parser('render-one', help="Render a single sequence")
+    render_one.add_argument('--seq-name', required=True)
+    render_one.add_argument('--strain-type', required=True, choices=sorted(CLADE_RESIDUES))
+    render_one.add_argument('--clade', required=True)
+    render_one.add_argument('--subclade', default=None)
+    render_one.add_argument('--H1-mutations', dest='H1_mutations', default='')
+    render_one.add_argument('--H2-mutations', dest='H2_mutations', default='')
+    render_one.add_argument('--cif-file-path', default=None)
+    render_one.add_argument('--color', default=DEFAULT_MUTATION_COLOR)
+    add_numbering_option(render_one)
+    add_output_options(render_one)
+
+    analyze = subparsers.add_parser('analyze', help="Summarize mutation sets across a manifest without starting PyMOL")
+    analyze.add_argument('manifest')
+    add_numbering_option(analyze, rows=True)
+    analyze.add_argument('--reference', default=None, help="seq_name to compare the cohort against (e.g. the vaccine strain)")
+    analyze.add_argument('--min-frequency', type=float, default=None, help="Report residues mutated in at least this fraction of sequences")
+
+    return parser
+
+def main(argv=None):
+    """Command line entry point; with no command (e.g. 'run' from the PyMOL GUI) only the functions are loaded."""
+    if argv is None:
+        argv = sys.argv[1:]
+        if '--' in argv:
+            argv = argv[argv.index('--') + 1:]
+    if not argv or argv[0] not in COMMANDS:
+        print("Loaded Functions")
+        return 0
+    args = build_parser().parse_args(argv)
+    return COMMANDS[args.command](args)
+
+
+if __name__ in ('__main__', 'pymol'):
+    # Under 'pymol -cq' (and PyMOL's `run`) this file runs as 'pymol', and exiting has to go through PyMOL
+    status = main()
+    if status:
+        if __name__ == 'pymol':
+            cmd.quit(status)
+        sys.exit(status)
  
 
 # ----------------------------------------------
@@ -375,5 +834,4 @@ print("Loaded Functions")
 # Example 2: Generate images with no mutations
 # Copy and paste the following line into the PyMOL command line (instructions for filling out command below):
 # process_sequence(seq_name='your_sequence_name', cif_file_path='/path_to_your_cif_file.cif', strain_type='H1N1', clade='your_clade', subclade='your_subclade', H1_mutations=[], H2_mutations=[])
-
-process_sequence(seq_name='Test', cif_file_path=cif_file_path_H1, strain_type='H1N1', clade ='5a.2a', subclade='C.1', H1_mutations=[], H2_mutations=[])
+# process_sequence(seq_name='Test', cif_file_path=cif_file_path_H1, strain_type='H1N1', clade ='5a.2a', subclade='C.1', H1_mutations=[], H2_mutations=[])
@@ -0,0 +1,243 @@
+# cohort.py
+
+# Cohort residue-set algebra for HA mutation categories.
+# Each sequence's mutations are stored as one row of a boolean matrix per chain group
+# (a bitset over residue positions), so unions, intersections, differences and
+# frequency thresholds across a whole season are single NumPy reductions.
+# Example (replaces the hand-typed H3_Represented / H3_Alternate / H3_NotRepresented lists):
+#   cohort = Cohort.from_records(records)            # all records of one strain type
+#   circulating = cohort.union()
+#   vaccine = cohort.sequence('H3_15_Consensus')
+#   categories = partition_categories([
+#       ('H3_Represented', circulating & vaccine, 'green'),
+#       ('H3_NotRepresented', circulating - vaccine, 'red'),
+#   ])
+#   render_cohort_overlay(categories)
+
+import numpy as np
+
+# Chains of the three protomers carrying HA1 ("H1") and HA2 ("H2") mutations, per strain type's structure
+# (4lxv for H1N1, 4o5n for H3N2; the same chain names as CLADE_RESIDUES in Pymol_mark_mutations.py)
+CHAIN_GROUPS = {
+    'H1N1': {'H1': 'A+C+E', 'H2': 'B+D+F'},
+    'H3N2': {'H1': 'A+A-2+A-3', 'H2': 'B+B-2+B-3'},
+}
+GROUPS = ('H1', 'H2')
+
+# Highest residue number tracked per chain group (HA1 is ~330 residues, HA2 ~220)
+MAX_RESIDUE = 600
+
+# ---------------------------------------------------
+# Residue Sets
+# ---------------------------------------------------
+
+def _check_strain_type(strain_type):
+    if strain_type not in CHAIN_GROUPS:
+        raise ValueError(f"Unknown strain type: {strain_type!r}. Please use 'H1N1' or 'H3N2'.")
+    return strain_type
+
+class ResidueSet:
+    """A set of mutated residue positions per chain group of one strain type, stored as boolean masks."""
+
+    def __init__(self, strain_type, masks=None):
+        self.strain_type = _check_strain_type(strain_type)
+        self.masks = {}
+        for group in GROUPS:
+            mask = None if masks is None else masks.get(group)
+            if mask is None:
+                mask = np.zeros(MAX_RESIDUE + 1, dtype=bool)
+            self.masks[group] = np.asarray(mask, dtype=bool)
+
+    @classmethod
+    def from_mutations(cls, strain_type, H1_mutations=None, H2_mutations=None):
+        """Build a residue set from HA1/HA2 mutation lists."""
+        return cls(strain_type, {
+            'H1': _mask_from_positions(H1_mutations),
+            'H2': _mask_from_positions(H2_mutations),
+        })
+
+    def _combine(self, other, op):
+        if other.strain_type != self.strain_type:
+            raise ValueError(f"Cannot combine {self.strain_type} and {other.strain_type} residue sets; "
+                             f"their residue numbers refer to different structures.")
+        return ResidueSet(self.strain_type, {group: op(self.masks[group], other.masks[group]) for group in GROUPS})
+
+    def __or__(self, other):
+        return self._combine(other, np.logical_or)
+
+    def __and__(self, other):
+        return self._combine(other, np.logical_and)
+
+    def __sub__(self, other):
+        return self._combine(other, lambda a, b: a & ~b)
+
+    def __xor__(self, other):
+        return self._combine(other, np.logical_xor)
+
+    def __eq__(self, other):
+        if not isinstance(other, ResidueSet):
+            return NotImplemented
+        return self.strain_type == other.strain_type and all(
+            np.array_equal(self.masks[group], other.masks[group]) for group in GROUPS)
+
+    def __len__(self):
+        return int(sum(mask.sum() for mask in self.masks.values()))
+
+    def __bool__(self):
+        return any(mask.any() for mask in self.masks.values())
+
+    def residues(self, group):
+        """Return the sorted residue numbers set for a chain group ('H1' or 'H2')."""
+        return np.flatnonzero(self.masks[group]).tolist()
+
+    @property
+    def H1_mutations(self):
+        return self.residues('H1')
+
+    @property
+    def H2_mutations(self):
+        return self.residues('H2')
+
+    def selection_string(self):
+        """Build the PyMOL selection string for this set over all three protomers of its strain's structure."""
+        parts = []
+        for group, chains in CHAIN_GROUPS[self.strain_type].items():
+            residues = self.residues(group)
+            if residues:
+                parts.append(f"(chain {chains} and resi {'+'.join(map(str, residues))})")
+        return " or ".join(parts)
+
+    def __repr__(self):
+        return (f"ResidueSet({self.strain_type!r}, H1_mutations={self.H1_mutations}, "
+                f"H2_mutations={self.H2_mutations})")
+
+
+def _check_positions(positions):
+    """Residue numbers start at 1, as in validate_record(); bit 0 is never set."""
+    if positions.min() < 1 or positions.max() > MAX_RESIDUE:
+        raise ValueError(f"Residue positions must be between 1 and {MAX_RESIDUE}.")
+    return positions
+
+def _mask_from_positions(positions):
+    mask = np.zeros(MAX_RESIDUE + 1, dtype=bool)
+    if positions:
+        mask[_check_positions(np.asarray(list(positions), dtype=np.int64))] = True
+    return mask
+
+# ---------------------------------------------------
+# Cohorts
+# ---------------------------------------------------
+
+class Cohort:
+    """The mutation sets of many sequences of one strain type, one bitset row per sequence and chain group."""
+
+    def __init__(self, strain_type, seq_names, matrices):
+        self.strain_type = _check_strain_type(strain_type)
+        self.seq_names = list(seq_names)
+        self.matrices = {group: np.asarray(matrices[group], dtype=bool) for group in GROUPS}
+        self._index = {name: i for i, name in enumerate(self.seq_names)}
+        if len(self._index) != len(self.seq_names):
+            raise ValueError("Sequence names in a cohort must be unique.")
+
+    @classmethod
+    def from_records(cls, records, strain_type=None):
+        """Build a cohort from dicts with seq_name, H1_mutations and H2_mutations keys.
+
+        The strain type is taken from the records' strain_type keys unless given; records of different
+        strain types cannot share a cohort, since the same residue number means a different site in each.
+        """
+        records = list(records)
+        strain_types = {record['strain_type'] for record in records if record.get('strain_type')}
+        if strain_type is not None:
+            strain_types.add(strain_type)
+        if len(strain_types) != 1:
+            raise ValueError("A cohort needs records of exactly one strain type, got "
+                             f"{', '.join(sorted(strain_types)) or 'none'}; build one cohort per strain type.")
+        strain_type = strain_types.pop()
+        seq_names = [record['seq_name'] for record in records]
+        matrices = {}
+        for group in GROUPS:
+            key = f'{group}_mutations'
+            rows, cols = [], []
+            for row, record in enumerate(records):
+                positions = record.get(key) or []
+                rows.extend([row] * len(positions))
+                cols.extend(positions)
+            matrix = np.zeros((len(records), MAX_RESIDUE + 1), dtype=bool)
+            if cols:
+                cols = _check_positions(np.asarray(cols, dtype=np.int64))
+                matrix[np.asarray(rows, dtype=np.int64), cols] = True
+            matrices[group] = matrix
+        return cls(strain_type, seq_names, matrices)
+
+    def __len__(self):
+        return len(self.seq_names)
+
+    def subset(self, seq_names):
+        """Return a new cohort restricted to the given sequence names."""
+        seq_names = list(seq_names)
+        rows = [self._index[name] for name in seq_names]
+        return Cohort(self.strain_type, seq_names, {group: matrix[rows] for group, matrix in self.matrices.items()})
+
+    def sequence(self, seq_name):
+        """Return the residue set of a single sequence."""
+        row = self._index[seq_name]
+        return ResidueSet(self.strain_type, {group: matrix[row] for group, matrix in self.matrices.items()})
+
+    def union(self):
+        """Residues mutated in any sequence of the cohort."""
+        return ResidueSet(self.strain_type, {group: matrix.any(axis=0) for group, matrix in self.matrices.items()})
+
+    def intersection(self):
+        """Residues mutated in every sequence of the cohort."""
+        return ResidueSet(self.strain_type, {group: matrix.all(axis=0) if len(self) else matrix.any(axis=0)
+                           for group, matrix in self.matrices.items()})
+
+    def counts(self):
+        """Number of sequences carrying a mutation at each residue, per chain group."""
+        return {group: matrix.sum(axis=0) for group, matrix in self.matrices.items()}
+
+    def frequency(self):
+        """Fraction of sequences carrying a mutation at each residue, per chain group."""
+        total = max(len(self), 1)
+        return {group: counts / total for group, counts in self.counts().items()}
+
+    def at_least(self, fraction):
+        """Residues mutated in at least the given fraction (0 < fraction <= 1) of sequences."""
+        if not 0 < fraction <= 1:
+            raise ValueError(f"Frequency threshold must be above 0 and at most 1, got {fraction}.")
+        counts = self.counts()
+        return ResidueSet(self.strain_type, {group: (freq >= fraction) & (counts[group] > 0)
+                                             for group, freq in self.frequency().items()})
+
+# ---------------------------------------------------
+# Multi-Category Overlay
+# ---------------------------------------------------
+
+def partition_categories(categories):
+    """Make (name, residue_set, color) categories disjoint, earlier categories taking priority."""
+    claimed = None
+    partitioned = []
+    for name, residue_set, color in categories:
+        if claimed is None:
+            claimed = ResidueSet(residue_set.strain_type)
+        own = residue_set - claimed
+        claimed = claimed | own
+        partitioned.append((name, own, color))
+    return partitioned
+
+
+def render_cohort_overlay(categories, object_name='all'):
+    """Color every (name, residue_set, color) category on the loaded structure in a single pass."""
+    from pymol import cmd
+
+    for name, residue_set, color in categories:
+        selection_string = residue_set.selection_string()
+        if not selection_string:
+            print(f"Category {name} has no residues, skipping.")
+            continue
+        cmd.select(name, f"({object_name}) and ({selection_string})")
+        cmd.color(color, name)
+        cmd.show('surface', name)
+        cmd.set('surface_color', color, name)
+    cmd.deselect()
@@ -0,0 +1,293 @@
+# job_scheduler.py
+
+# Cost-aware planning and scheduling of a batch of sequences.
+# A batch is built into a job graph that shares common prefixes:
+#   load structure -> style template (antigenic sites, clade, subclade) -> mutation layer -> per-view renders -> session
+# Sequences on the same structure load it once, and sequences with the same style are restored from an in-memory
+# snapshot of the styled scene instead of being rebuilt. Every node's cost is estimated from the timings recorded
+# by earlier runs, and the groups are poured longest-first into the workers, each filled up to an even share of the
+# work, so the predicted wall time stays within about one job of total work divided by workers.
+# Example:
+#   pymol -cq Pymol_mark_mutations.py -- batch sequences.csv --workers 8 --dry-run   # print the plan only
+#   pymol -cq Pymol_mark_mutations.py -- batch sequences.csv --workers 8
+
+import json
+import os
+import time
+from collections import defaultdict
+
+from Pymol_mark_mutations import DEFAULT_MUTATION_COLOR, VIEWS
+
+DEFAULT_TIMINGS_LOCATION = os.path.join(os.path.dirname(__file__), 'Code_output', 'timings.json')
+
+# Seconds assumed for a stage that has never been timed
+DEFAULT_COSTS = {
+    'load': 3.0,
+    'style': 0.5,
+    'restore': 0.5,
+    'mutation': 0.1,
+    'render': 20.0,
+    'session': 1.0,
+}
+
+PROTEINS = {
+    'H1N1': 'H1',
+    'H3N2': 'H3',
+}
+
+# ---------------------------------------------------
+# Timing History
+# ---------------------------------------------------
+
+def stage_key(stage, protein, view=None, tiles=None):
+    """Key under which a stage's timings are recorded, e.g. 'render:H3:side' or 'render:H1:top:tiles8'."""
+    key = f"{stage}:{protein}"
+    if view:
+        key += f":{view}"
+    if tiles:
+        key += f":tiles{tiles}"
+    return key
+
+def load_timings(timings_path=None):
+    """Return the recorded timings as {key: {'mean': seconds, 'count': n}}."""
+    timings_path = timings_path or DEFAULT_TIMINGS_LOCATION
+    if not os.path.exists(timings_path):
+        return {}
+    with open(timings_path) as handle:
+        return json.load(handle)
+
+def record_timings(samples, timings_path=None):
+    """Fold {key: [seconds, ...]} from a run into the running means stored at timings_path."""
+    timings_path = timings_path or DEFAULT_TIMINGS_LOCATION
+    timings = load_timings(timings_path)
+    for key, values in samples.items():
+        entry = timings.setdefault(key, {'mean': 0.0, 'count': 0})
+        total = entry['mean'] * entry['count'] + sum(values)
+        entry['count'] += len(values)
+        entry['mean'] = total / entry['count']
+    os.makedirs(os.path.dirname(timings_path) or '.', exist_ok=True)
+    with open(timings_path, 'w') as handle:
+        json.dump(timings, handle, indent=2, sort_keys=True)
+
+def estimate(timings, stage, protein, view=None, tiles=None):
+    """Estimated seconds for one stage, falling back to the untiled render time and then to DEFAULT_COSTS."""
+    for key in (stage_key(stage, protein, view, tiles), stage_key(stage, protein, view)):
+        if key in timings:
+            return timings[key]['mean']
+    return DEFAULT_COSTS[stage]
+
+# ---------------------------------------------------
+# Job Graph
+# ---------------------------------------------------
+
+def build_job_graph(records, cif_file_paths, views=VIEWS, save_session=True, tiles=None, timings=None):
+    """Group records into structure -> style -> job prefixes, with an estimated cost on every node.
+
+    cif_file_paths maps strain type to the structure file to load. Returns a list of structure groups:
+    {'strain_type', 'protein', 'cif_file_path', 'load', 'restore', 'styles': [{'clade', 'subclade', 'style', 'jobs': [...]}]}
+    where every job is {'record', 'cost'}. Restoring a snapshot is charged separately (see chunk_cost()), since the
+    first style of a chunk and the first job of a style start from the scene as it is.
+    """
+    timings = timings or {}
+    structures = {}
+    for record in records:
+        strain_type = record['strain_type']
+        protein = PROTEINS[strain_type]
+        group = structures.get(strain_type)
+        if group is None:
+            group = structures[strain_type] = {
+                'strain_type': strain_type,
+                'protein': protein,
+                'cif_file_path': cif_file_paths[strain_type],
+                'load': estimate(timings, 'load', protein),
+                'restore': estimate(timings, 'restore', protein),
+                'styles': {},
+            }
+        style_key = (record['clade'], record.get('subclade'))
+        style = group['styles'].get(style_key)
+        if style is None:
+            style = group['styles'][style_key] = {
+                'clade': record['clade'],
+                'subclade': record.get('subclade'),
+                'style': estimate(timings, 'style', protein),
+                'jobs': [],
+            }
+        cost = estimate(timings, 'mutation', protein)
+        cost += sum(estimate(timings, 'render', protein, view, tiles) for view in views)
+        if save_session:
+            cost += estimate(timings, 'session', protein)
+        style['jobs'].append({'record': record, 'cost': cost})
+
+    groups = []
+    for group in structures.values():
+        group['styles'] = list(group['styles'].values())
+        groups.append(group)
+    return groups
+
+def chunk_cost(chunk):
+    """Estimated seconds to run one chunk: its structure load, each style once, every job, and the restores between them."""
+    cost = chunk['load'] + chunk['restore'] * max(len(chunk['styles']) - 1, 0)
+    for style in chunk['styles']:
+        cost += style['style'] + sum(job['cost'] for job in style['jobs'])
+        cost += chunk['restore'] * max(len(style['jobs']) - 1, 0)
+    return cost
+
+def schedule(groups, workers):
+    """Assign structure groups to workers; returns a list of (load, [chunks]) per worker.
+
+    Groups (and the styles within them) are taken longest-first and poured into the workers in turn, each worker
+    filled up to an even share of the work (McNaughton's wrap-around rule). A group that crosses a worker boundary
+    is cut between two jobs, and the piece on the next worker repeats the structure load and style. The share is
+    recomputed at every cut from the work still to place, repeated loads included, over the workers still empty.
+    """
+    groups = sorted(groups, key=chunk_cost, reverse=True)
+    items = [(group, style, job)
+             for group in groups
+             for style in sorted(group['styles'], key=lambda style: len(style['jobs']), reverse=True)
+             for job in style['jobs']]
+    workers = max(1, min(workers, len(items)))
+
+    def step(index, previous):
+        """Seconds added by running items[index] after previous (the item before it on the same worker, or None)."""
+        group, style, job = items[index]
+        if previous is None or previous[0] is not group:
+            return group['load'] + style['style'] + job['cost']
+        if previous[1] is not style:
+            return group['restore'] + style['style'] + job['cost']
+        return group['restore'] + job['cost']
+
+    # after[i]: seconds to run items[i:] straight on from items[i - 1]
+    after = [0.0] * (len(items) + 1)
+    for index in range(len(items) - 1, 0, -1):
+        after[index] = after[index + 1] + step(index, items[index - 1][:2])
+
+    plan = [[0.0, []] for _ in range(workers)]
+    worker, previous, chunk, piece = 0, None, None, None
+    share = (step(0, None) + after[1]) / workers if items else 0.0
+    for index, (group, style, job) in enumerate(items):
+        cost = step(index, previous)
+        load = plan[worker][0]
+        # Move on to the next worker at whichever side of its share is nearer
+        if previous is not None and worker < workers - 1 and load + cost - share > share - load:
+            worker += 1
+            previous, chunk, piece = None, None, None
+            cost = step(index, None)
+            share = (cost + after[index + 1]) / (workers - worker)
+
+        if previous is None or previous[0] is not group:
+            chunk = dict(group, styles=[])
+            plan[worker][1].append(chunk)
+            piece = None
+        if piece is None or previous[1] is not style:
+            piece = dict(style, jobs=[])
+            chunk['styles'].append(piece)
+        piece['jobs'].append(job)
+        plan[worker][0] += cost
+        previous = (group, style)
+    return [(load, chunks) for load, chunks in plan if chunks]
+
+def plan_batch(records, cif_file_paths, workers=1, views=VIEWS, save_session=True, tiles=None, timings_path=None):
+    """Build, split and schedule a batch; returns the per-worker plan."""
+    timings = load_timings(timings_path)
+    groups = build_job_graph(records, cif_file_paths, views=views, save_session=save_session, tiles=tiles,
+                             timings=timings)
+    return schedule(groups, workers)
+
+def format_plan(plan, records):
+    """Describe a plan and its predicted wall time."""
+    lines = []
+    total = sum(load for load, _ in plan)
+    for worker, (load, chunks) in enumerate(plan):
+        lines.append(f"worker {worker}: {load:8.1f} s")
+        for chunk in chunks:
+            jobs = sum(len(style['jobs']) for style in chunk['styles'])
+            lines.append(f"    {chunk['protein']}: {len(chunk['styles'])} styles, {jobs} sequences, {chunk_cost(chunk):.1f} s")
+    makespan = max((load for load, _ in plan), default=0.0)
+    lines.append(f"{len(records)} sequences, {total:.1f} s of work on {len(plan)} workers")
+    lines.append(f"predicted wall time {makespan:.1f} s (ideal {total / max(len(plan), 1):.1f} s)")
+    return "\n".join(lines)
+
+# ---------------------------------------------------
+# Execution
+# ---------------------------------------------------
+
+def run_chunks(chunks, views=VIEWS, save_session=True, tiles=None, output_location=None, session_location=None,
+               output_archive=None):
+    """Run chunks in this process's PyMOL instance, sharing loaded and styled scenes; returns {key: [seconds]}."""
+    import Pymol_mark_mutations
+    from pymol import cmd
+
+    samples = defaultdict(list)
+
+    def timed(key, function, *args, **kwargs):
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        samples[key].append(time.perf_counter() - start)
+        return result
+
+    # The same stages as process_sequence(), with a snapshot of the scene after loading and after styling
+    def load(strain_type, cif_file_path):
+        Pymol_mark_mutations.load_structure(strain_type, cif_file_path)
+        return cmd.get_session()
+
+    def apply_style(strain_type, clade, subclade):
+        Pymol_mark_mutations.apply_style(strain_type, clade, subclade)
+        return cmd.get_session()
+
+    for chunk in chunks:
+        strain_type, protein = chunk['strain_type'], chunk['protein']
+        loaded = timed(stage_key('load', protein), load, strain_type, chunk['cif_file_path'])
+
+        for style_index, style in enumerate(chunk['styles']):
+            if style_index:
+                timed(stage_key('restore', protein), cmd.set_session, loaded)
+            styled = timed(stage_key('style', protein), apply_style, strain_type, style['clade'], style['subclade'])
+
+            for job_index, job in enumerate(style['jobs']):
+                record = job['record']
+                if job_index:
+                    timed(stage_key('restore', protein), cmd.set_session, styled)
+                timed(stage_key('mutation', protein), Pymol_mark_mutations.assess_mutations_HA, record['seq_name'],
+                      record['H1_mutations'], record['H2_mutations'], color=record.get('color') or DEFAULT_MUTATION_COLOR)
+                # Every view is timed on its own, with the tile workers shared between the views of a sequence
+                with Pymol_mark_mutations.open_tile_renderer(tiles) as renderer:
+                    for view in views:
+                        timed(stage_key('render', protein, view, tiles), Pymol_mark_mutations.export_images,
+                              record['seq_name'], protein, style['clade'], style['subclade'], views=(view,),
+                              output_location=output_location, tiles=tiles, output_archive=output_archive,
+                              renderer=renderer)
+                if save_session:
+                    timed(stage_key('session', protein), Pymol_mark_mutations.save_pymol_session,
+                          seq_name=record['seq_name'], clade=style['clade'], subclade=style['subclade'],
+                          protein=protein, output_location=session_location, output_archive=output_archive)
+    return dict(samples)
+
+def run_plan(plan, views=VIEWS, save_session=True, tiles=None, output_location=None, session_location=None,
+             output_archive=None, timings_path=None):
+    """Run a plan, one worker process per plan entry (in this process for a single worker), and record timings."""
+    if not plan:
+        print("Nothing to run: the plan has no sequences.")
+        return {}
+
+    options = dict(views=views, save_session=save_session, tiles=tiles, output_location=output_location,
+                   session_location=session_location, output_archive=output_archive)
+    start = time.perf_counter()
+    if len(plan) == 1:
+        results = [run_chunks(plan[0][1], **options)]
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        from multiprocessing import get_context
+
+        with ProcessPoolExecutor(max_workers=len(plan), mp_context=get_context('spawn')) as pool:
+            futures = [pool.submit(run_chunks, chunks, **options) for _, chunks in plan]
+            results = [future.result() for future in futures]
+
+    samples = defaultdict(list)
+    for result in results:
+        for key, values in result.items():
+            samples[key].extend(values)
+    record_timings(samples, timings_path)
+
+    predicted = max(load for load, _ in plan)
+    print(f"Batch finished in {time.perf_counter() - start:.1f} s (predicted {predicted:.1f} s)")
+    return samples
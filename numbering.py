@@ -0,0 +1,350 @@
+# numbering.py
+
+# Residue numbering translation tables for the bundled HA structures.
+# Mutation positions can be written in several numbering schemes:
+#   'pdb'         - author numbering of the structure file (what PyMOL's `resi` selects), with insertion codes
+#   'mature'      - mature HA1/HA2 numbering of the structure's own subtype
+#   'full_length' - numbering of the full-length HA including the signal peptide (HA2 continues after HA1)
+#   'H3'          - H3 numbering, obtained for non-H3 structures by aligning each chain to the H3 reference structure
+# Each structure's table is built once from its cif file and stored as arrays, so a whole manifest is translated
+# with a single array lookup per chain group.
+# Example:
+#   translate('4lxv', 'H1', [136, 225], 'H3', 'pdb')   -> ['133', '222'] author numbers for PyMOL `resi`
+#   translate_manifest(records, source='H3')             -> records with H1/H2 mutations in PDB numbering
+
+import os
+from functools import lru_cache
+
+import numpy as np
+
+STRUCTURE_DIR = os.path.join(os.path.dirname(__file__), 'Structure_files')
+
+SCHEMES = ('pdb', 'mature', 'full_length', 'H3')
+
+# Marks residues that have no number in a scheme (author numbering can be zero or negative)
+MISSING = -10 ** 6
+
+# Per-structure numbering facts. HA1 chain A and HA2 chain B are used to build the table; the other protomers
+# in the assembly share the same numbering.
+STRUCTURES = {
+    '4lxv': {
+        'cif_file': '4lxv-assembly1.cif',
+        'chains': {'H1': 'A', 'H2': 'B'},
+        'signal_peptide': 17,   # MKAILVVLLYTFATANA
+        'HA1_length': 327,
+        'mature_offset': 0,     # author numbering is mature H1pdm numbering
+        'H3_reference': '4o5n',
+    },
+    '4o5n': {
+        'cif_file': '4o5n-assembly1.cif',
+        'chains': {'H1': 'A', 'H2': 'B'},
+        'signal_peptide': 16,   # MKTIIALSYILCLVFA
+        'HA1_length': 329,
+        'mature_offset': 0,     # author numbering is mature H3 numbering
+        'H3_reference': None,
+    },
+}
+
+STRAIN_STRUCTURES = {
+    'H1N1': '4lxv',
+    'H3N2': '4o5n',
+}
+
+THREE_TO_ONE = {
+    'ALA': 'A', 'ARG': 'R', 'ASN': 'N', 'ASP': 'D', 'CYS': 'C', 'GLN': 'Q', 'GLU': 'E', 'GLY': 'G', 'HIS': 'H', 'ILE': 'I',
+    'LEU': 'L', 'LYS': 'K', 'MET': 'M', 'PHE': 'F', 'PRO': 'P', 'SER': 'S', 'THR': 'T', 'TRP': 'W', 'TYR': 'Y', 'VAL': 'V',
+}
+
+# ---------------------------------------------------
+# Reading Structures
+# ---------------------------------------------------
+
+def read_poly_seq_scheme(cif_file_path, chain):
+    """Return (one-letter sequence, author numbers, insertion codes) for a chain from _pdbx_poly_seq_scheme."""
+    columns = []
+    rows = []
+    in_loop = False
+    with open(cif_file_path) as handle:
+        for line in handle:
+            if line.startswith('_pdbx_poly_seq_scheme.'):
+                in_loop = True
+                columns.append(line.split('.', 1)[1].strip())
+                continue
+            if in_loop:
+                if line.startswith('#') or line.startswith('_') or line.startswith('loop_'):
+                    break
+                rows.append(line.split())
+
+    index = {name: i for i, name in enumerate(columns)}
+    sequence, numbers, insertion_codes = [], [], []
+    for row in rows:
+        if row[index['pdb_strand_id']] != chain:
+            continue
+        sequence.append(THREE_TO_ONE.get(row[index['mon_id']], 'X'))
+        numbers.append(int(row[index['pdb_seq_num']]))
+        code = row[index['pdb_ins_code']]
+        insertion_codes.append('' if code in ('.', '?') else code)
+    if not sequence:
+        raise ValueError(f"Chain {chain} not found in {cif_file_path}.")
+    return ''.join(sequence), np.asarray(numbers, dtype=np.int64), np.asarray(insertion_codes, dtype='<U1')
+
+# ---------------------------------------------------
+# Alignment to the H3 Reference
+# ---------------------------------------------------
+
+_BLOSUM62_ORDER = 'ARNDCQEGHILKMFPSTWYV'
+_BLOSUM62 = np.array([
+    [ 4, -1, -2, -2,  0, -1, -1,  0, -2, -1, -1, -1, -1, -2, -1,  1,  0, -3, -2,  0],
+    [-1,  5,  0, -2, -3,  1,  0, -2,  0, -3, -2,  2, -1, -3, -2, -1, -1, -3, -2, -3],
+    [-2,  0,  6,  1, -3,  0,  0,  0,  1, -3, -3,  0, -2, -3, -2,  1,  0, -4, -2, -3],
+    [-2, -2,  1,  6, -3,  0,  2, -1, -1, -3, -4, -1, -3, -3, -1,  0, -1, -4, -3, -3],
+    [ 0, -3, -3, -3,  9, -3, -4, -3, -3, -1, -1, -3, -1, -2, -3, -1, -1, -2, -2, -1],
+    [-1,  1,  0,  0, -3,  5,  2, -2,  0, -3, -2,  1,  0, -3, -1,  0, -1, -2, -1, -2],
+    [-1,  0,  0,  2, -4,  2,  5, -2,  0, -3, -3,  1, -2, -3, -1,  0, -1, -3, -2, -2],
+    [ 0, -2,  0, -1, -3, -2, -2,  6, -2, -4, -4, -2, -3, -3, -2,  0, -2, -2, -3, -3],
+    [-2,  0,  1, -1, -3,  0,  0, -2,  8, -3, -3, -1, -2, -1, -2, -1, -2, -2,  2, -3],
+    [-1, -3, -3, -3, -1, -3, -3, -4, -3,  4,  2, -3,  1,  0, -3, -2, -1, -3, -1,  3],
+    [-1, -2, -3, -4, -1, -2, -3, -4, -3,  2,  4, -2,  2,  0, -3, -2, -1, -2, -1,  1],
+    [-1,  2,  0, -1, -3,  1,  1, -2, -1, -3, -2,  5, -1, -3, -1,  0, -1, -3, -2, -2],
+    [-1, -1, -2, -3, -1,  0, -2, -3, -2,  1,  2, -1,  5,  0, -2, -1, -1, -1, -1,  1],
+    [-2, -3, -3, -3, -2, -3, -3, -3, -1,  0,  0, -3,  0,  6, -4, -2, -2,  1,  3, -1],
+    [-1, -2, -2, -1, -3, -1, -1, -2, -2, -3, -3, -1, -2, -4,  7, -1, -1, -4, -3, -2],
+    [ 1, -1,  1,  0, -1,  0,  0,  0, -1, -2, -2,  0, -1, -2, -1,  4,  1, -3, -2, -2],
+    [ 0, -1,  0, -1, -1, -1, -1, -2, -2, -1, -1, -1, -1, -2, -1,  1,  5, -2, -2,  0],
+    [-3, -3, -4, -4, -2, -2, -3, -2, -2, -3, -2, -3, -1,  1, -4, -3, -2, 11,  2, -3],
+    [-2, -2, -2, -3, -2, -1, -2, -3,  2, -1, -1, -2, -1,  3, -3, -2, -2,  2,  7, -1],
+    [ 0, -3, -3, -3, -1, -2, -2, -3, -3,  3,  1, -2,  1, -1, -2, -2,  0, -3, -1,  4],
+])
+GAP_OPEN = -10
+GAP_EXTEND = -1
+
+def align_sequences(query, reference):
+    """Globally align two protein sequences (BLOSUM62, affine gaps, free end gaps).
+
+    Returns an array with, for every query residue, the index of the aligned reference residue or -1.
+    """
+    lookup = {aa: i for i, aa in enumerate(_BLOSUM62_ORDER)}
+    q = np.array([lookup.get(aa, -1) for aa in query])
+    r = np.array([lookup.get(aa, -1) for aa in reference])
+    scores = np.where((q[:, None] >= 0) & (r[None, :] >= 0), _BLOSUM62[q[:, None], r[None, :]], -1).tolist()
+
+    n, m = len(query), len(reference)
+    negative = -10 ** 9
+    # Three states per cell: 0 = query[i-1] aligned to reference[j-1], 1 = reference[j-1] opposite a gap,
+    # 2 = query[i-1] opposite a gap. End gaps are free so that construct tags and unresolved termini
+    # do not distort the alignment.
+    best = [[[negative] * 3 for _ in range(m + 1)] for _ in range(n + 1)]
+    came_from = [[[0] * 3 for _ in range(m + 1)] for _ in range(n + 1)]
+    best[0][0] = [0, negative, negative]
+    for j in range(1, m + 1):
+        best[0][j] = [negative, 0, negative]
+        came_from[0][j][1] = 1
+    for i in range(1, n + 1):
+        best[i][0] = [negative, negative, 0]
+        came_from[i][0][2] = 2
+
+    for i in range(1, n + 1):
+        for j in range(1, m + 1):
+            cell, links = best[i][j], came_from[i][j]
+
+            diagonal = best[i - 1][j - 1]
+            state = max(range(3), key=diagonal.__getitem__)
+            cell[0], links[0] = diagonal[state] + scores[i - 1][j - 1], state
+
+            left = best[i][j - 1]
+            opening, extend = (0, 0) if i == n else (GAP_OPEN, GAP_EXTEND)
+            options = (left[0] + opening, left[1] + extend, left[2] + opening)
+            state = max(range(3), key=options.__getitem__)
+            cell[1], links[1] = options[state], state
+
+            up = best[i - 1][j]
+            opening, extend = (0, 0) if j == m else (GAP_OPEN, GAP_EXTEND)
+            options = (up[0] + opening, up[1] + opening, up[2] + extend)
+            state = max(range(3), key=options.__getitem__)
+            cell[2], links[2] = options[state], state
+
+    mapping = np.full(n, -1, dtype=np.int64)
+    i, j = n, m
+    state = max(range(3), key=best[n][m].__getitem__)
+    while i > 0 or j > 0:
+        previous = came_from[i][j][state]
+        if state == 0:
+            mapping[i - 1] = j - 1
+            i, j = i - 1, j - 1
+        elif state == 1:
+            j -= 1
+        else:
+            i -= 1
+        state = previous
+    return mapping
+
+# ---------------------------------------------------
+# Numbering Tables
+# ---------------------------------------------------
+
+class NumberingTable:
+    """Numbering of every residue of one chain group in one structure, one array per scheme."""
+
+    def __init__(self, numbers, insertion_codes):
+        # numbers[scheme] and insertion_codes[scheme] are arrays with one entry per residue
+        self.numbers = numbers
+        self.insertion_codes = insertion_codes
+        self._lookups = {}
+        for scheme in SCHEMES:
+            self._lookups[scheme] = self._build_lookup(numbers[scheme], insertion_codes[scheme])
+
+    @staticmethod
+    def _build_lookup(numbers, insertion_codes):
+        # Dense array from residue number (shifted to start at 0) to row; only residues without insertion codes
+        valid = numbers != MISSING
+        plain = valid & (insertion_codes == '')
+        offset = max(-int(numbers[valid].min()), 0) if valid.any() else 0
+        size = int(numbers[valid].max()) + offset + 1 if valid.any() else 1
+        lookup = np.full(size, -1, dtype=np.int64)
+        lookup[numbers[plain] + offset] = np.flatnonzero(plain)
+        return offset, lookup
+
+    def rows(self, positions, scheme):
+        """Return the table row of each position in `scheme` (-1 where the position does not exist)."""
+        positions = np.asarray(positions, dtype=np.int64)
+        offset, lookup = self._lookups[scheme]
+        shifted = positions + offset
+        inside = (shifted >= 0) & (shifted < len(lookup))
+        rows = np.full(positions.shape, -1, dtype=np.int64)
+        rows[inside] = lookup[shifted[inside]]
+        return rows
+
+    def translate(self, positions, source, target):
+        """Translate positions from one scheme to another; returns (numbers, insertion_codes, found)."""
+        rows = self.rows(positions, source)
+        found = rows >= 0
+        numbers = np.where(found, self.numbers[target][rows], MISSING)
+        codes = np.where(found, self.insertion_codes[target][rows], '')
+        found &= numbers != MISSING
+        return numbers, codes, found
+
+
+def _h3_numbers(structure, group, sequence, mature):
+    """H3 numbers and insertion codes for a chain, by alignment to the H3 reference structure."""
+    config = STRUCTURES[structure]
+    reference = config['H3_reference']
+    if reference is None:
+        return mature.copy(), np.full(len(mature), '', dtype='<U1')
+
+    reference_config = STRUCTURES[reference]
+    reference_sequence, reference_numbers, _ = read_poly_seq_scheme(
+        os.path.join(STRUCTURE_DIR, reference_config['cif_file']), reference_config['chains'][group])
+    reference_numbers = reference_numbers - reference_config['mature_offset']
+
+    # Only mature residues are aligned; construct tags before the mature N-terminus get no H3 number
+    mature_rows = np.flatnonzero(mature >= 1)
+    mapping = np.full(len(sequence), -1, dtype=np.int64)
+    mapping[mature_rows] = align_sequences(''.join(sequence[i] for i in mature_rows), reference_sequence)
+
+    numbers = np.full(len(sequence), MISSING, dtype=np.int64)
+    codes = np.full(len(sequence), '', dtype='<U1')
+    aligned = mapping >= 0
+    numbers[aligned] = reference_numbers[mapping[aligned]]
+
+    # Residues inserted relative to H3 take the preceding H3 number with an insertion code (e.g. 133A);
+    # overhangs past the last aligned residue have no H3 counterpart
+    last_aligned = np.flatnonzero(aligned)[-1] if aligned.any() else -1
+    previous, inserted = MISSING, 0
+    for i in range(last_aligned):
+        if aligned[i]:
+            previous, inserted = numbers[i], 0
+        elif previous != MISSING:
+            numbers[i] = previous
+            codes[i] = chr(ord('A') + min(inserted, 25))
+            inserted += 1
+    return numbers, codes
+
+
+@lru_cache(maxsize=None)
+def numbering_table(structure, group):
+    """Build (once per process) the numbering table for chain group 'H1' or 'H2' of a bundled structure."""
+    config = STRUCTURES[structure]
+    sequence, pdb_numbers, pdb_codes = read_poly_seq_scheme(
+        os.path.join(STRUCTURE_DIR, config['cif_file']), config['chains'][group])
+
+    mature = pdb_numbers - config['mature_offset']
+    if group == 'H1':
+        full_length = mature + config['signal_peptide']
+    else:
+        full_length = mature + config['signal_peptide'] + config['HA1_length']
+    no_codes = np.full(len(sequence), '', dtype='<U1')
+    h3, h3_codes = _h3_numbers(structure, group, sequence, mature)
+
+    # Residues before the mature N-terminus (construct tags) have no mature or full-length number
+    before_mature = mature < 1
+    mature = np.where(before_mature, MISSING, mature)
+    full_length = np.where(before_mature, MISSING, full_length)
+
+    numbers = {'pdb': pdb_numbers, 'mature': mature, 'full_length': full_length, 'H3': h3}
+    insertion_codes = {'pdb': pdb_codes, 'mature': no_codes, 'full_length': no_codes, 'H3': h3_codes}
+    return NumberingTable(numbers, insertion_codes)
+
+# ---------------------------------------------------
+# Translation
+# ---------------------------------------------------
+
+def format_resi(numbers, codes):
+    """Combine residue numbers and insertion codes into PyMOL `resi` strings (e.g. '133A')."""
+    return [f"{number}{code}" for number, code in zip(numbers.tolist(), codes.tolist())]
+
+def translate(structure, group, positions, source, target='pdb'):
+    """Translate positions of one chain group between numbering schemes; untranslatable positions raise."""
+    if source not in SCHEMES or target not in SCHEMES:
+        raise ValueError(f"Unknown numbering scheme; use one of {', '.join(SCHEMES)}.")
+    positions = np.asarray(list(positions), dtype=np.int64)
+    numbers, codes, found = numbering_table(structure, group).translate(positions, source, target)
+    if not found.all():
+        missing = positions[~found].tolist()
+        raise ValueError(f"{group} positions {missing} in {source} numbering have no {target} residue in {structure}.")
+    return format_resi(numbers, codes)
+
+def translate_manifest(records, source, target='pdb'):
+    """Translate the H1/H2 mutations of every manifest record in bulk, one array lookup per structure and chain group.
+
+    Records are dicts with strain_type, H1_mutations and H2_mutations; new records are returned.
+    """
+    records = [dict(record) for record in records]
+    if source == target:
+        return records
+
+    for structure in set(STRAIN_STRUCTURES.values()):
+        members = [record for record in records if STRAIN_STRUCTURES.get(record.get('strain_type')) == structure]
+        if not members:
+            continue
+        for group in ('H1', 'H2'):
+            key = f'{group}_mutations'
+            lengths = [len(record.get(key) or []) for record in members]
+            flat = [position for record in members for position in record.get(key) or []]
+            if not flat:
+                continue
+            translated = translate(structure, group, flat, source, target)
+            split_points = np.cumsum(lengths)[:-1]
+            for record, chunk in zip(members, np.split(np.asarray(translated, dtype=object), split_points)):
+                record[key] = chunk.tolist()
+    return records
+
+def untranslatable_positions(records, source, target='pdb'):
+    """For every record, the {group: [positions]} that have no residue in the target scheme, checked in bulk.
+
+    With source == target this checks that the positions exist in the structure at all. Records of unknown
+    strain types are not checked (their entry is an empty dict).
+    """
+    problems = [{} for _ in records]
+
+    for structure in set(STRAIN_STRUCTURES.values()):
+        members = [i for i, record in enumerate(records) if STRAIN_STRUCTURES.get(record.get('strain_type')) == structure]
+        for group in ('H1', 'H2'):
+            key = f'{group}_mutations'
+            owners = [i for i in members for _ in records[i].get(key) or []]
+            if not owners:
+                continue
+            positions = np.asarray([position for i in members for position in records[i].get(key) or []], dtype=np.int64)
+            _, _, found = numbering_table(structure, group).translate(positions, source, target)
+            for i, position in zip(np.asarray(owners)[~found].tolist(), positions[~found].tolist()):
+                problems[i].setdefault(group, []).append(position)
+    return problems
@@ -0,0 +1,217 @@
+# output_archive.py
+
+# Single-file output archive for images and sessions.
+# Instead of thousands of small files under Code_output/Images/<protein>/ and Code_output/Sessions/<protein>/,
+# renders and sessions are appended to one pack file with an append-only index next to it:
+#   <archive>      - records of (header, JSON metadata, data), only ever appended to
+#   <archive>.idx  - one JSON line per record with its name, data offset, length and seq_name/view/kind
+# Appends take an exclusive lock on the pack, so several workers can write to the same archive, and the cost of
+# an append is proportional to the bytes written. A failed append is truncated away, and the partial tail of one
+# that crashed is dropped by the next append. Each record carries its own metadata, so if the index is lost
+# rebuild_index() recovers it from the pack.
+# Command line:
+#   python output_archive.py list Code_output/outputs.pack
+#   python output_archive.py extract Code_output/outputs.pack --output-location Code_output --seq-name H3_01_AAID07
+
+import fcntl
+import json
+import os
+import struct
+
+MAGIC = b'HAPACK1\n'
+RECORD_HEADER = struct.Struct('>4sIQ')   # record marker, metadata length, data length
+RECORD_MARKER = b'REC0'
+
+# ---------------------------------------------------
+# Writing
+# ---------------------------------------------------
+
+def _check_name(name):
+    """Record names are relative paths inside the extraction directory."""
+    if not name or os.path.isabs(name) or '..' in name.replace('\\', '/').split('/'):
+        raise ValueError(f"Archive entry name {name!r} must be a relative path without '..'.")
+    return name
+
+def append_bytes(archive_path, name, data, **metadata):
+    """Append one named record to the archive and index it; safe to call from several processes at once."""
+    _check_name(name)
+    encoded_metadata = json.dumps(dict(metadata, name=name)).encode('utf-8')
+    directory = os.path.dirname(archive_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    with open(archive_path, 'ab') as pack:
+        fcntl.flock(pack, fcntl.LOCK_EX)
+        try:
+            pack.seek(0, os.SEEK_END)
+            # Drop the partial tail of an append that crashed, so it never ends up between two records
+            end = _indexed_end(archive_path + '.idx')
+            if end is not None and pack.tell() > end:
+                pack.truncate(end)
+                pack.seek(end)
+            start = pack.tell()
+            try:
+                if start == 0:
+                    pack.write(MAGIC)
+                offset = pack.tell() + RECORD_HEADER.size + len(encoded_metadata)
+                pack.write(RECORD_HEADER.pack(RECORD_MARKER, len(encoded_metadata), len(data)))
+                pack.write(encoded_metadata)
+                pack.write(data)
+                pack.flush()
+            except BaseException:
+                pack.truncate(start)
+                raise
+
+            entry = dict(metadata, name=name, offset=offset, length=len(data))
+            with open(archive_path + '.idx', 'a') as index:
+                index.write(json.dumps(entry) + '\n')
+        finally:
+            fcntl.flock(pack, fcntl.LOCK_UN)
+    return entry
+
+def _indexed_end(index_path):
+    """End offset of the last indexed record, or None if there is no index to tell."""
+    if not os.path.exists(index_path):
+        return None
+    with open(index_path, 'rb') as index:
+        size = index.seek(0, os.SEEK_END)
+        index.seek(max(size - 65536, 0))
+        for line in reversed(index.read().splitlines()):
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue    # a partially written last line from an interrupted append
+            return entry['offset'] + entry['length']
+    return None
+
+def append_file(archive_path, name, file_path, remove=True, **metadata):
+    """Append the contents of a file (e.g. a freshly written PNG or PSE) to the archive."""
+    with open(file_path, 'rb') as handle:
+        data = handle.read()
+    entry = append_bytes(archive_path, name, data, **metadata)
+    if remove:
+        os.remove(file_path)
+    return entry
+
+# ---------------------------------------------------
+# Reading
+# ---------------------------------------------------
+
+def read_index(archive_path):
+    """Return {name: entry} for the archive; a name written more than once resolves to its latest record."""
+    entries = {}
+    index_path = archive_path + '.idx'
+    if not os.path.exists(index_path):
+        return rebuild_index(archive_path) if os.path.exists(archive_path) else entries
+    with open(index_path) as index:
+        for line in index:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue    # a partially written last line from an interrupted append
+            entries[entry['name']] = entry
+    return entries
+
+def rebuild_index(archive_path):
+    """Recreate the index by walking the record headers in the pack, holding the pack lock against appends."""
+    entries = {}
+    with open(archive_path, 'rb') as pack:
+        fcntl.flock(pack, fcntl.LOCK_EX)
+        if pack.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{archive_path} is not an output archive.")
+        size = os.fstat(pack.fileno()).st_size
+        while pack.tell() + RECORD_HEADER.size <= size:
+            marker, metadata_length, data_length = RECORD_HEADER.unpack(pack.read(RECORD_HEADER.size))
+            if marker != RECORD_MARKER:
+                raise ValueError(f"Corrupt record header at offset {pack.tell() - RECORD_HEADER.size}.")
+            offset = pack.tell() + metadata_length
+            if offset + data_length > size:
+                break   # truncated final record
+            entry = json.loads(pack.read(metadata_length).decode('utf-8'))
+            entry.update(offset=offset, length=data_length)
+            entries[entry['name']] = entry
+            pack.seek(data_length, os.SEEK_CUR)
+
+        # Written while the lock is held, so no append can add a line that the new index would then lose
+        with open(archive_path + '.idx.tmp', 'w') as index:
+            for entry in sorted(entries.values(), key=lambda entry: entry['offset']):
+                index.write(json.dumps(entry) + '\n')
+        os.replace(archive_path + '.idx.tmp', archive_path + '.idx')
+    return entries
+
+def read_entry(archive_path, entry):
+    """Read the data of one index entry."""
+    with open(archive_path, 'rb') as pack:
+        pack.seek(entry['offset'])
+        return pack.read(entry['length'])
+
+def find_entries(archive_path, seq_name=None, view=None, kind=None):
+    """Return index entries matching the given seq_name, view ('side'/'top') and kind ('image'/'session')."""
+    matches = []
+    for entry in read_index(archive_path).values():
+        if seq_name is not None and entry.get('seq_name') != seq_name:
+            continue
+        if view is not None and entry.get('view') != view:
+            continue
+        if kind is not None and entry.get('kind') != kind:
+            continue
+        matches.append(entry)
+    return matches
+
+def extract(archive_path, output_location, entries=None):
+    """Write entries (default: all) to output_location, recreating their relative paths."""
+    if entries is None:
+        entries = read_index(archive_path).values()
+    entries = list(entries)
+    # Check every name before writing anything, so a bad entry cannot leave a partial extraction
+    for entry in entries:
+        try:
+            _check_name(entry['name'])
+        except ValueError:
+            raise ValueError(f"Refusing to extract {entry['name']!r} outside {output_location}.") from None
+    written = []
+    with open(archive_path, 'rb') as pack:
+        for entry in entries:
+            full_path = os.path.join(output_location, entry['name'])
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            pack.seek(entry['offset'])
+            with open(full_path, 'wb') as handle:
+                handle.write(pack.read(entry['length']))
+            written.append(full_path)
+    return written
+
+# ---------------------------------------------------
+# Command Line
+# ---------------------------------------------------
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='output_archive', description="List or extract an output archive.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    for command in ('list', 'extract'):
+        subparser = subparsers.add_parser(command)
+        subparser.add_argument('archive')
+        subparser.add_argument('--seq-name', default=None)
+        subparser.add_argument('--view', default=None, choices=['side', 'top'])
+        subparser.add_argument('--kind', default=None, choices=['image', 'session'])
+        if command == 'extract':
+            subparser.add_argument('--output-location', default='.', help="Directory to extract into")
+    args = parser.parse_args(argv)
+
+    entries = find_entries(args.archive, seq_name=args.seq_name, view=args.view, kind=args.kind)
+    if args.command == 'list':
+        for entry in sorted(entries, key=lambda entry: entry['name']):
+            print(f"{entry['length']:>12}  {entry['name']}")
+        print(f"{len(entries)} entries")
+    else:
+        for full_path in extract(args.archive, args.output_location, entries):
+            print(f"Extracted: {full_path}")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
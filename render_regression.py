@@ -0,0 +1,274 @@
+# render_regression.py
+
+# Golden-image render regression suite.
+# Renders a fixed set of reference jobs from the bundled structures through process_sequence(), and compares
+# every image to a stored golden image with vectorized per-pixel and perceptual (SSIM) diffs. Rendering and
+# comparison both run in parallel worker processes, and render timings are reported next to the pixel deltas
+# so that a change to a view matrix, a site color or a render setting shows up before it reaches every output.
+# check also renders one job tiled and untiled (both orthoscopic) and requires the two images to match.
+# Timings are only comparable between runs with the same number of workers.
+# The golden images and their timings belong in Regression_files/golden/, which ships empty: run update once on a
+# machine with PyMOL, review the images, and commit them so check compares against a reviewed reference rather than
+# whatever was last rendered. Until then check fails. Regenerate them only for an intended visual change (a new
+# view, color or render setting, or a PyMOL upgrade), and commit them together with that change.
+# Command line (PyMOL must be importable from the Python running this file):
+#   python render_regression.py update     # render the reference jobs and store them as the golden images
+#   python render_regression.py check      # render again and compare against the golden images
+
+import json
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import numpy as np
+
+DEFAULT_GOLDEN_LOCATION = os.path.join(os.path.dirname(__file__), 'Regression_files', 'golden')
+DEFAULT_DIFF_LOCATION = os.path.join(os.path.dirname(__file__), 'Code_output', 'Regression', 'diff')
+
+# Reference jobs: one per strain/clade style, with mutations on both HA1 and HA2
+REFERENCE_JOBS = [
+    {'seq_name': 'REF_H1_C1', 'strain_type': 'H1N1', 'clade': '5a.2a', 'subclade': 'C.1',
+     'H1_mutations': [137], 'H2_mutations': [91, 177]},
+    {'seq_name': 'REF_H1_D3', 'strain_type': 'H1N1', 'clade': '5a.2a.1', 'subclade': 'D.3',
+     'H1_mutations': [], 'H2_mutations': []},
+    {'seq_name': 'REF_H3_G11', 'strain_type': 'H3N2', 'clade': '2a.1', 'subclade': 'G.1.1',
+     'H1_mutations': [], 'H2_mutations': [174]},
+    {'seq_name': 'REF_H3_G2', 'strain_type': 'H3N2', 'clade': '2b', 'subclade': 'G.2',
+     'H1_mutations': [50, 242], 'H2_mutations': [139, 202]},
+]
+
+# Tiled rendering must reproduce the untiled orthoscopic render of the same scene
+TILING_JOB = REFERENCE_JOBS[2]
+TILING_TILES = 4
+
+# Tolerances: a channel difference above PIXEL_THRESHOLD counts a pixel as changed
+PIXEL_THRESHOLD = 8
+MAX_CHANGED_FRACTION = 0.001
+MAX_MEAN_DIFFERENCE = 0.5
+MIN_SSIM = 0.995
+
+# ---------------------------------------------------
+# Rendering
+# ---------------------------------------------------
+
+def _render_job(job, output_location):
+    """Render one reference job in this worker's PyMOL instance; returns (seq_name, seconds)."""
+    import Pymol_mark_mutations
+
+    from pymol import cmd
+    cmd.set('max_threads', 1)
+
+    start = time.perf_counter()
+    Pymol_mark_mutations.process_sequence(cif_file_path=None, output_location=output_location,
+                                          save_session=False, output_archive=False, **job)
+    return job['seq_name'], time.perf_counter() - start
+
+def render_reference_jobs(output_location, workers=None):
+    """Render every reference job into output_location in parallel; returns {seq_name: seconds}."""
+    os.makedirs(output_location, exist_ok=True)
+    workers = min(workers or os.cpu_count() or 1, len(REFERENCE_JOBS))
+    # process_sequence() starts from clear_all_selections(), so a worker can render several jobs in turn
+    with ProcessPoolExecutor(max_workers=workers, mp_context=get_context('spawn')) as pool:
+        results = pool.map(_render_job, REFERENCE_JOBS, [output_location] * len(REFERENCE_JOBS))
+        return dict(results)
+
+def _render_tiling_pair(job, output_location):
+    """Render the side view of one job untiled (orthoscopic) and tiled; returns the two image paths."""
+    import Pymol_mark_mutations
+
+    protein = Pymol_mark_mutations.load_structure(job['strain_type'])
+    Pymol_mark_mutations.apply_style(job['strain_type'], job['clade'], job['subclade'])
+    Pymol_mark_mutations.assess_mutations_HA(job['seq_name'], job['H1_mutations'], job['H2_mutations'])
+
+    paths = []
+    for label, options in (('untiled', {'orthoscopic': True}), ('tiled', {'tiles': TILING_TILES})):
+        location = os.path.join(output_location, label)
+        Pymol_mark_mutations.generate_image(seq_name=job['seq_name'], view='side', protein=protein, clade=job['clade'],
+                                            subclade=job['subclade'], output_location=location,
+                                            output_archive=False, **options)
+        paths.append(next(iter(_image_paths(location).values())))
+    return paths
+
+def _image_paths(location):
+    """Return {relative path: full path} for every PNG under location."""
+    paths = {}
+    for directory, _, filenames in os.walk(location):
+        for filename in filenames:
+            if filename.endswith('.png'):
+                full_path = os.path.join(directory, filename)
+                paths[os.path.relpath(full_path, location)] = full_path
+    return paths
+
+# ---------------------------------------------------
+# Comparison
+# ---------------------------------------------------
+
+def _box_mean(values, window):
+    """Mean over window x window boxes (valid region only), via a summed-area table."""
+    table = np.pad(values, ((1, 0), (1, 0))).cumsum(axis=0).cumsum(axis=1)
+    box = table[window:, window:] - table[:-window, window:] - table[window:, :-window] + table[:-window, :-window]
+    return box / (window * window)
+
+def structural_similarity(first, second, window=7):
+    """Mean SSIM of the luminance of two RGB(A) images."""
+    weights = np.array([0.299, 0.587, 0.114])
+    x = first[..., :3].astype(np.float64) @ weights
+    y = second[..., :3].astype(np.float64) @ weights
+    c1, c2 = (0.01 * 255) ** 2, (0.03 * 255) ** 2
+    window = max(1, min(window, x.shape[0], x.shape[1]))
+
+    mean_x, mean_y = _box_mean(x, window), _box_mean(y, window)
+    var_x = _box_mean(x * x, window) - mean_x ** 2
+    var_y = _box_mean(y * y, window) - mean_y ** 2
+    covariance = _box_mean(x * y, window) - mean_x * mean_y
+    ssim = ((2 * mean_x * mean_y + c1) * (2 * covariance + c2)) / ((mean_x ** 2 + mean_y ** 2 + c1) * (var_x + var_y + c2))
+    return float(ssim.mean())
+
+def compare_images(golden_path, current_path, diff_path=None):
+    """Compare two PNG files; returns a dict of pixel and perceptual differences and whether they pass."""
+    from tiled_render import read_png, write_png
+
+    # Colors only: an opaque alpha channel (cmd.png writes RGBA) carries no difference
+    golden, current = read_png(golden_path)[..., :3], read_png(current_path)[..., :3]
+    if golden.shape[:2] != current.shape[:2]:
+        return {'passed': False, 'reason': f"size changed from {golden.shape[1]}x{golden.shape[0]} "
+                                           f"to {current.shape[1]}x{current.shape[0]}"}
+
+    difference = np.abs(golden.astype(np.int16) - current.astype(np.int16))
+    per_pixel = difference.max(axis=2)
+    result = {
+        'mean_difference': float(difference.mean()),
+        'max_difference': int(difference.max()),
+        'changed_fraction': float((per_pixel > PIXEL_THRESHOLD).mean()),
+        'ssim': structural_similarity(golden, current),
+    }
+    failures = []
+    if result['changed_fraction'] > MAX_CHANGED_FRACTION:
+        failures.append(f"{result['changed_fraction']:.2%} of pixels changed")
+    if result['mean_difference'] > MAX_MEAN_DIFFERENCE:
+        failures.append(f"mean difference {result['mean_difference']:.2f}")
+    if result['ssim'] < MIN_SSIM:
+        failures.append(f"SSIM {result['ssim']:.4f}")
+    result['passed'] = not failures
+    result['reason'] = "; ".join(failures)
+
+    # Write a heat map of the changed pixels for failing images
+    if failures and diff_path:
+        os.makedirs(os.path.dirname(diff_path), exist_ok=True)
+        heat = np.clip(per_pixel.astype(np.int32) * 4, 0, 255).astype(np.uint8)
+        write_png(diff_path, np.stack([heat, np.zeros_like(heat), np.zeros_like(heat)], axis=2))
+    return result
+
+def _compare(args):
+    name, golden_path, current_path, diff_path = args
+    return name, compare_images(golden_path, current_path, diff_path)
+
+# ---------------------------------------------------
+# Suite
+# ---------------------------------------------------
+
+def update_golden(golden_location=None, workers=None):
+    """Render the reference jobs and store them (and their timings) as the new golden images."""
+    golden_location = golden_location or DEFAULT_GOLDEN_LOCATION
+    for full_path in _image_paths(golden_location).values():
+        os.remove(full_path)
+    timings = render_reference_jobs(golden_location, workers=workers)
+    with open(os.path.join(golden_location, 'timings.json'), 'w') as handle:
+        json.dump(timings, handle, indent=2, sort_keys=True)
+    print(f"Stored {len(_image_paths(golden_location))} golden images in {golden_location}; commit them with the change.")
+    return 0
+
+def check(golden_location=None, diff_location=None, workers=None):
+    """Render the reference jobs and compare them to the golden images; returns 0 if every image passes."""
+    golden_location = golden_location or DEFAULT_GOLDEN_LOCATION
+    diff_location = diff_location or DEFAULT_DIFF_LOCATION
+    golden_images = _image_paths(golden_location)
+    if not golden_images:
+        print(f"No golden images in {golden_location}; run 'python render_regression.py update' with PyMOL "
+              f"and commit the images.")
+        return 1
+    golden_timings = {}
+    timings_path = os.path.join(golden_location, 'timings.json')
+    if os.path.exists(timings_path):
+        with open(timings_path) as handle:
+            golden_timings = json.load(handle)
+
+    shutil.rmtree(diff_location, ignore_errors=True)
+    with tempfile.TemporaryDirectory(prefix='render_regression_') as current_location:
+        timings = render_reference_jobs(current_location, workers=workers)
+        current_images = _image_paths(current_location)
+
+        comparisons = [(name, golden_path, current_images[name], os.path.join(diff_location, name))
+                       for name, golden_path in sorted(golden_images.items()) if name in current_images]
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1) as pool:
+            results = dict(pool.map(_compare, comparisons))
+
+        # The tiling pair renders in its own PyMOL process; the tiled half starts its own tile workers
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as pool:
+            untiled_path, tiled_path = pool.submit(_render_tiling_pair, TILING_JOB, current_location).result()
+        tiling = compare_images(untiled_path, tiled_path, os.path.join(diff_location, 'tiled_vs_untiled.png'))
+
+    failures = 0
+    print(f"{'image':<48} {'status':<6} {'changed':>8} {'mean':>6} {'ssim':>7}")
+    for name in sorted(set(golden_images) | set(current_images)):
+        if name not in current_images:
+            failures += 1
+            print(f"{name:<48} {'MISSING':<6}")
+            continue
+        if name not in golden_images:
+            failures += 1
+            print(f"{name:<48} {'NEW':<6}")
+            continue
+        result = results[name]
+        if not result['passed']:
+            failures += 1
+        if 'ssim' not in result:
+            print(f"{name:<48} {'FAIL':<6} {result['reason']}")
+            continue
+        status = 'ok' if result['passed'] else 'FAIL'
+        print(f"{name:<48} {status:<6} {result['changed_fraction']:>8.3%} {result['mean_difference']:>6.2f} "
+              f"{result['ssim']:>7.4f}  {result['reason']}")
+
+    name = f"tiled ({TILING_TILES}) vs untiled {TILING_JOB['seq_name']}"
+    if not tiling['passed']:
+        failures += 1
+    if 'ssim' in tiling:
+        status = 'ok' if tiling['passed'] else 'FAIL'
+        print(f"{name:<48} {status:<6} {tiling['changed_fraction']:>8.3%} {tiling['mean_difference']:>6.2f} "
+              f"{tiling['ssim']:>7.4f}  {tiling['reason']}")
+    else:
+        print(f"{name:<48} {'FAIL':<6} {tiling['reason']}")
+
+    print(f"\n{'job':<16} {'golden s':>9} {'current s':>10} {'delta':>8}")
+    for seq_name in sorted(timings):
+        before, after = golden_timings.get(seq_name), timings[seq_name]
+        if before:
+            print(f"{seq_name:<16} {before:>9.2f} {after:>10.2f} {(after - before) / before:>+8.1%}")
+        else:
+            print(f"{seq_name:<16} {'-':>9} {after:>10.2f}")
+
+    print(f"\n{failures} of {len(set(golden_images) | set(current_images)) + 1} images failed.")
+    if failures:
+        print(f"Heat maps of changed pixels: {diff_location}")
+    return 1 if failures else 0
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='render_regression', description="Golden-image render regression suite.")
+    parser.add_argument('command', choices=['update', 'check'])
+    parser.add_argument('--golden-location', default=None, help="Default: Regression_files/golden")
+    parser.add_argument('--diff-location', default=None, help="Heat maps of failing images (default: Code_output/Regression/diff)")
+    parser.add_argument('--workers', type=int, default=None, help="Parallel render/compare processes (default: all cores)")
+    args = parser.parse_args(argv)
+
+    if args.command == 'update':
+        return update_golden(args.golden_location, args.workers)
+    return check(args.golden_location, args.diff_location, args.workers)
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
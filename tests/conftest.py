@@ -0,0 +1,6 @@
+# Tests for the modules that run without PyMOL; run with `python -m pytest` from the repository root.
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
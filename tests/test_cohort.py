@@ -0,0 +1,59 @@
+import pytest
+
+from cohort import MAX_RESIDUE, Cohort, ResidueSet, partition_categories
+
+RECORDS = [
+    {'seq_name': 'H3_01', 'strain_type': 'H3N2', 'H1_mutations': [50, 160], 'H2_mutations': [174]},
+    {'seq_name': 'H3_02', 'strain_type': 'H3N2', 'H1_mutations': [50], 'H2_mutations': []},
+    {'seq_name': 'H3_15_Consensus', 'strain_type': 'H3N2', 'H1_mutations': [50, 242], 'H2_mutations': []},
+]
+
+
+def test_set_algebra():
+    cohort = Cohort.from_records(RECORDS)
+    vaccine = cohort.sequence('H3_15_Consensus')
+    assert cohort.union().H1_mutations == [50, 160, 242]
+    assert cohort.intersection().H1_mutations == [50]
+    assert (cohort.union() - vaccine).H1_mutations == [160]
+    assert (cohort.union() - vaccine).H2_mutations == [174]
+
+
+def test_selection_covers_all_h3_protomers():
+    residue_set = ResidueSet.from_mutations('H3N2', [50], [174])
+    assert residue_set.selection_string() == "(chain A+A-2+A-3 and resi 50) or (chain B+B-2+B-3 and resi 174)"
+
+
+def test_strain_types_do_not_mix():
+    with pytest.raises(ValueError):
+        Cohort.from_records(RECORDS + [{'seq_name': 'H1_01', 'strain_type': 'H1N1', 'H1_mutations': [50]}])
+    with pytest.raises(ValueError):
+        ResidueSet.from_mutations('H3N2', [50]) | ResidueSet.from_mutations('H1N1', [50])
+
+
+def test_at_least():
+    cohort = Cohort.from_records(RECORDS)
+    assert cohort.at_least(0.5).H1_mutations == [50]
+    assert cohort.at_least(1 / 3).H1_mutations == [50, 160, 242]
+    for fraction in (0, -0.5, 1.5):
+        with pytest.raises(ValueError):
+            cohort.at_least(fraction)
+
+
+@pytest.mark.parametrize('position', [0, -1, MAX_RESIDUE + 1])
+def test_position_range(position):
+    with pytest.raises(ValueError):
+        ResidueSet.from_mutations('H1N1', [position])
+    with pytest.raises(ValueError):
+        Cohort.from_records([{'seq_name': 'x', 'strain_type': 'H1N1', 'H1_mutations': [position]}])
+
+
+def test_partition_categories_are_disjoint():
+    cohort = Cohort.from_records(RECORDS)
+    circulating, vaccine = cohort.union(), cohort.sequence('H3_15_Consensus')
+    (_, represented, _), (_, missing, _) = partition_categories([
+        ('Represented', circulating & vaccine, 'green'),
+        ('NotRepresented', circulating, 'red'),
+    ])
+    assert represented.H1_mutations == [50, 242]
+    assert missing.H1_mutations == [160]
+    assert not represented & missing
@@ -0,0 +1,38 @@
+import pytest
+
+from job_scheduler import build_job_graph, chunk_cost, schedule
+
+CIF_FILE_PATHS = {'H1N1': '4lxv.cif', 'H3N2': '4o5n.cif'}
+
+
+def make_records(count, strain_type='H3N2', styles=1):
+    return [{'seq_name': f'seq_{index}', 'strain_type': strain_type, 'clade': f'clade_{index % styles}',
+             'subclade': None, 'H1_mutations': [], 'H2_mutations': []} for index in range(count)]
+
+
+def scheduled_jobs(plan):
+    return [job['record']['seq_name'] for _, chunks in plan for chunk in chunks
+            for style in chunk['styles'] for job in style['jobs']]
+
+
+@pytest.mark.parametrize('count, workers', [(203, 64), (10, 3), (7, 7), (5, 8), (100, 1)])
+def test_every_worker_is_used_and_every_job_placed_once(count, workers):
+    records = make_records(count, styles=3)
+    plan = schedule(build_job_graph(records, CIF_FILE_PATHS), workers)
+    assert len(plan) == min(count, workers)
+    assert sorted(scheduled_jobs(plan)) == sorted(record['seq_name'] for record in records)
+
+
+def test_plan_loads_match_chunk_costs():
+    records = make_records(40, styles=4) + make_records(25, strain_type='H1N1', styles=2)
+    for load, chunks in schedule(build_job_graph(records, CIF_FILE_PATHS), 6):
+        assert load == pytest.approx(sum(chunk_cost(chunk) for chunk in chunks))
+
+
+def test_wall_time_stays_within_one_job_of_ideal():
+    groups = build_job_graph(make_records(203), CIF_FILE_PATHS)
+    job_cost = groups[0]['styles'][0]['jobs'][0]['cost']
+    plan = schedule(groups, 64)
+    makespan = max(load for load, _ in plan)
+    ideal = sum(load for load, _ in plan) / len(plan)
+    assert makespan <= ideal + job_cost + groups[0]['load'] + groups[0]['styles'][0]['style']
@@ -0,0 +1,44 @@
+import pytest
+
+import Pymol_mark_mutations
+from Pymol_mark_mutations import load_manifest, main, validate_records
+
+MANIFEST = """seq_name,strain_type,clade,subclade,H1_mutations,H2_mutations,numbering
+H1_01,H1N1,5a.2a,C.1,,91 177,
+H1_02,H1N1,5a.2a,C.1,222,,H3
+BAD_TOKEN,H1N1,5a.2a,C.1,50x,,
+BAD_POSITION,H1N1,5a.2a,C.1,700,,
+BAD_CLADE,H3N2,9z,,50,,
+H3_01,H3N2,2a.1,G.1.1,,174,
+"""
+
+
+@pytest.fixture
+def manifest(tmp_path):
+    path = tmp_path / 'sequences.csv'
+    path.write_text(MANIFEST)
+    return str(path)
+
+
+def test_validate_records_reports_each_bad_row(manifest):
+    records = load_manifest(manifest)
+    problems = dict(zip((record['seq_name'] for record in records), validate_records(records)))
+    assert [name for name, own in problems.items() if own] == ['BAD_TOKEN', 'BAD_POSITION', 'BAD_CLADE']
+    assert 'not a list of residue numbers' in problems['BAD_TOKEN'][0]
+    assert 'no residue in 4lxv' in problems['BAD_POSITION'][0]
+
+
+def test_commands_exit_non_zero_on_skipped_rows(manifest, capsys):
+    assert main(['validate', manifest]) == 1
+    assert main(['analyze', manifest]) == 1
+    assert '3/6 sequences valid.' in capsys.readouterr().out
+
+
+def test_non_command_only_loads_functions(capsys):
+    assert main(['-cq']) == 0
+    assert capsys.readouterr().out.strip() == "Loaded Functions"
+
+
+def test_star_import_leaves_cmd_out():
+    assert 'cmd' not in Pymol_mark_mutations.__all__
+    assert all(hasattr(Pymol_mark_mutations, name) for name in Pymol_mark_mutations.__all__)
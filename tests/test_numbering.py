@@ -0,0 +1,68 @@
+import pytest
+
+from numbering import STRUCTURES, translate, translate_manifest, untranslatable_positions
+
+# Known H1pdm (4lxv author numbering) to H3 numbering pairs: the start of mature HA1, the 133a insertion and the
+# receptor-binding site residues D187/D190, D222/D225 and Q223/Q226
+H1_TO_H3 = [
+    (1, '11'),
+    (2, '12'),
+    (130, '133A'),
+    (131, '134'),
+    (187, '190'),
+    (222, '225'),
+    (223, '226'),
+]
+
+
+@pytest.mark.parametrize('pdb, h3', H1_TO_H3)
+def test_h1_to_h3(pdb, h3):
+    assert translate('4lxv', 'H1', [pdb], 'pdb', 'H3') == [h3]
+
+
+def test_h3_to_h1():
+    assert translate('4lxv', 'H1', [136, 225, 11], 'H3', 'pdb') == ['133', '222', '1']
+
+
+def test_h3_structure_numbering_is_h3_numbering():
+    assert translate('4o5n', 'H1', [50, 160, 225], 'H3', 'pdb') == ['50', '160', '225']
+    assert translate('4lxv', 'H2', [1, 50], 'pdb', 'H3') == ['1', '50']
+
+
+@pytest.mark.parametrize('structure', ['4lxv', '4o5n'])
+def test_full_length_adds_the_signal_peptide_and_ha1(structure):
+    config = STRUCTURES[structure]
+    assert translate(structure, 'H1', [100], 'mature', 'full_length') == [str(100 + config['signal_peptide'])]
+    assert translate(structure, 'H2', [1], 'mature', 'full_length') == [
+        str(config['signal_peptide'] + config['HA1_length'] + 1)]
+
+
+def test_untranslatable_positions_raise():
+    with pytest.raises(ValueError):
+        translate('4lxv', 'H1', [700], 'pdb', 'H3')
+    with pytest.raises(ValueError):
+        translate('4lxv', 'H1', [1], 'pdb', 'kabat')
+
+
+def test_translate_manifest():
+    records = [
+        {'seq_name': 'H1_01', 'strain_type': 'H1N1', 'H1_mutations': [136, 225], 'H2_mutations': [50]},
+        {'seq_name': 'H3_01', 'strain_type': 'H3N2', 'H1_mutations': [160], 'H2_mutations': [174]},
+        {'seq_name': 'H1_02', 'strain_type': 'H1N1', 'H1_mutations': [], 'H2_mutations': []},
+    ]
+    translated = translate_manifest(records, source='H3')
+    assert [record['H1_mutations'] for record in translated] == [['133', '222'], ['160'], []]
+    assert [record['H2_mutations'] for record in translated] == [['50'], ['174'], []]
+    assert records[0]['H1_mutations'] == [136, 225]   # the input records are left as they were
+
+
+def test_untranslatable_positions_per_record():
+    records = [
+        {'strain_type': 'H1N1', 'H1_mutations': [136, 225], 'H2_mutations': []},
+        {'strain_type': 'H3N2', 'H1_mutations': [160, 2], 'H2_mutations': [174]},
+        {'strain_type': 'H1N1', 'H1_mutations': [], 'H2_mutations': [5000]},
+        {'strain_type': 'H5N1', 'H1_mutations': [1], 'H2_mutations': []},
+    ]
+    assert untranslatable_positions(records, 'H3') == [{}, {'H1': [2]}, {'H2': [5000]}, {}]
+    # In the structure's own numbering, positions must exist in the structure
+    assert untranslatable_positions(records, 'pdb') == [{}, {'H1': [2]}, {'H2': [5000]}, {}]
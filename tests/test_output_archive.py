@@ -0,0 +1,59 @@
+import json
+import os
+
+import pytest
+
+from output_archive import RECORD_HEADER, RECORD_MARKER, append_bytes, extract, find_entries, read_entry, read_index
+
+
+@pytest.fixture
+def archive(tmp_path):
+    path = str(tmp_path / 'outputs.pack')
+    append_bytes(path, 'Images/H3/A_side.png', b'side', seq_name='A', view='side', kind='image')
+    append_bytes(path, 'Images/H3/A_top.png', b'top', seq_name='A', view='top', kind='image')
+    append_bytes(path, 'Sessions/H3/A.pse', b'session', seq_name='A', kind='session')
+    return path
+
+
+def test_read_back_and_find(archive):
+    index = read_index(archive)
+    assert read_entry(archive, index['Images/H3/A_top.png']) == b'top'
+    assert [entry['name'] for entry in find_entries(archive, kind='image', view='side')] == ['Images/H3/A_side.png']
+
+
+def test_latest_record_wins(archive):
+    append_bytes(archive, 'Images/H3/A_top.png', b'top again', seq_name='A', view='top', kind='image')
+    assert read_entry(archive, read_index(archive)['Images/H3/A_top.png']) == b'top again'
+
+
+def test_lost_index_is_rebuilt(archive):
+    os.remove(archive + '.idx')
+    assert sorted(read_index(archive)) == ['Images/H3/A_side.png', 'Images/H3/A_top.png', 'Sessions/H3/A.pse']
+    assert read_index(archive)['Sessions/H3/A.pse']['kind'] == 'session'
+
+
+def test_crashed_append_is_dropped(archive):
+    size = os.path.getsize(archive)
+    with open(archive, 'ab') as pack:
+        pack.write(RECORD_HEADER.pack(RECORD_MARKER, 12, 4096) + b'{"name": ')
+    entry = append_bytes(archive, 'Images/H3/B_side.png', b'B', seq_name='B')
+    assert entry['offset'] == size + RECORD_HEADER.size + len(json.dumps({'seq_name': 'B', 'name': entry['name']}))
+    os.remove(archive + '.idx')
+    assert read_entry(archive, read_index(archive)['Images/H3/B_side.png']) == b'B'
+
+
+@pytest.mark.parametrize('name', ['/etc/passwd', '../outside.png', 'Images/../../outside.png', ''])
+def test_unsafe_names_are_rejected(archive, name):
+    with pytest.raises(ValueError):
+        append_bytes(archive, name, b'x')
+
+
+def test_extract_checks_every_name_first(archive, tmp_path):
+    entries = list(read_index(archive).values()) + [{'name': '../outside.png', 'offset': 0, 'length': 1}]
+    with pytest.raises(ValueError):
+        extract(archive, str(tmp_path / 'out'), entries)
+    assert not (tmp_path / 'out').exists()
+
+    written = extract(archive, str(tmp_path / 'out'))
+    assert len(written) == 3
+    assert (tmp_path / 'out' / 'Sessions' / 'H3' / 'A.pse').read_bytes() == b'session'
@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from render_regression import compare_images
+from tiled_render import read_png, read_ppm, split_extent, tile_view, write_png
+
+VIEW = [1, 0, 0, 0, 1, 0, 0, 0, 1, 0, 0, -400.0, 0, 0, 0, 380.0, 420.0, 20.0]
+
+
+def test_split_extent_covers_every_row_once():
+    strips = split_extent(1000, 64)
+    assert strips[0][0] == 0 and strips[-1][1] == 1000
+    assert all(stop == start for (_, stop), (start, _) in zip(strips, strips[1:]))
+    assert {stop - start for start, stop in strips} <= {15, 16}
+
+
+def test_tile_view_keeps_the_projection_flag_out_of_view():
+    strips = split_extent(1000, 64)
+    views = [tile_view(VIEW, 800, 1000, start, stop) for start, stop in strips]
+    # Narrow strips have a field of view below 1 degree, which set_view() would read as the orthoscopic flag
+    assert all(view[17] == VIEW[17] for view, _ in views)
+    assert all(0 < fov < 1 for _, fov in views)
+    # Strip centres are symmetric about the image centre and the top strip looks above it
+    assert views[0][0][10] == pytest.approx(-views[-1][0][10])
+    assert views[0][0][10] < 0
+
+
+def test_tiles_of_the_full_image_keep_its_field_of_view():
+    view, fov = tile_view(VIEW, 800, 1000, 0, 1000)
+    assert fov == pytest.approx(VIEW[17])
+    assert view[10] == pytest.approx(VIEW[10])
+
+
+@pytest.mark.parametrize('channels', [3, 4])
+def test_png_round_trip(tmp_path, channels):
+    pixels = np.random.default_rng(0).integers(0, 256, (17, 23, channels), dtype=np.uint8)
+    write_png(tmp_path / 'image.png', pixels, dpi=300)
+    assert np.array_equal(read_png(tmp_path / 'image.png'), pixels)
+
+
+def test_read_ppm(tmp_path):
+    pixels = np.arange(4 * 3 * 3, dtype=np.uint8).reshape(4, 3, 3)
+    (tmp_path / 'tile.ppm').write_bytes(b'P6\n# PyMOL\n3 4\n255\n' + pixels.tobytes())
+    assert np.array_equal(read_ppm(tmp_path / 'tile.ppm'), pixels)
+
+
+def test_compare_ignores_an_opaque_alpha_channel(tmp_path):
+    rgb = np.full((32, 32, 3), 200, dtype=np.uint8)
+    write_png(tmp_path / 'rgb.png', rgb)
+    write_png(tmp_path / 'rgba.png', np.concatenate([rgb, np.full((32, 32, 1), 255, np.uint8)], axis=2))
+    assert compare_images(str(tmp_path / 'rgb.png'), str(tmp_path / 'rgba.png'))['passed']
@@ -0,0 +1,308 @@
+# tiled_render.py
+
+# Tiled parallel ray tracing for single high-resolution images.
+# The prepared scene is saved once as a temporary session; worker processes each load it into their own
+# PyMOL instance, ray trace horizontal strips of the final image with a narrowed and shifted view, and the
+# strips are stitched back together with NumPy into the final PNG.
+# Tiles are rendered with an orthoscopic projection: PyMOL cannot ray trace an off-axis perspective frustum,
+# and with orthoscopic rays a shifted, narrowed view covers exactly the pixels of one strip of the full image.
+# The stitched image therefore matches an untiled cmd.png() of the same scene with orthoscopic on, not a
+# perspective render (generate_image(..., orthoscopic=True) renders that untiled counterpart).
+# A TiledRenderer keeps its worker pool (each worker with PyMOL imported and the scene loaded) for several images of
+# one scene, so the side and top views of a sequence pay that startup once.
+# Example (after the view has been set, as generate_image() does):
+#   render_tiled('/path/to/image.png', tiles=8, dpi=300)
+
+import os
+import struct
+import tempfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import numpy as np
+
+# Strips per worker; uneven strips (empty background vs. dense protein) balance better when there are more of them
+TILES_PER_WORKER = 2
+
+# ---------------------------------------------------
+# Tile Geometry
+# ---------------------------------------------------
+
+def split_extent(size, parts):
+    """Split `size` pixels into `parts` contiguous (start, stop) ranges whose lengths differ by at most one."""
+    parts = max(1, min(parts, size))
+    edges = np.linspace(0, size, parts + 1).round().astype(int)
+    return [(int(start), int(stop)) for start, stop in zip(edges[:-1], edges[1:])]
+
+def tile_view(view, width, height, row_start, row_stop):
+    """Return the (view matrix, field of view) that render image rows [row_start, row_stop) of a width x height image.
+
+    The field of view is returned separately rather than written into view[17]: set_view() reads values
+    between 0 and 1 there as the old orthoscopic on/off flag, which narrow strips would fall into.
+    """
+    view = list(view)
+    fov = abs(view[17])
+    tan_half = np.tan(np.radians(fov / 2.0))
+
+    # World-space height of the full image at the camera distance, and of one pixel
+    world_height = 2.0 * abs(view[11]) * tan_half
+    pixel_size = world_height / height
+
+    # Narrow the field of view to the strip and move the strip centre to the image centre
+    tile_height = row_stop - row_start
+    tile_center = (row_start + row_stop) / 2.0
+    view[10] += (tile_center - height / 2.0) * pixel_size
+    tile_fov = float(np.degrees(2.0 * np.arctan(tan_half * tile_height / height)))
+    return view, tile_fov
+
+# ---------------------------------------------------
+# Image I/O
+# ---------------------------------------------------
+
+def read_ppm(path):
+    """Read a binary (P6) PPM file written by PyMOL into an (height, width, 3) uint8 array."""
+    with open(path, 'rb') as handle:
+        data = handle.read()
+    fields = []
+    position = 0
+    while len(fields) < 4:
+        while data[position:position + 1].isspace():
+            position += 1
+        if data[position:position + 1] == b'#':
+            position = data.index(b'\n', position) + 1
+            continue
+        end = position
+        while not data[end:end + 1].isspace():
+            end += 1
+        fields.append(data[position:end])
+        position = end
+    if fields[0] != b'P6' or int(fields[3]) != 255:
+        raise ValueError(f"{path} is not an 8-bit binary PPM file.")
+    width, height = int(fields[1]), int(fields[2])
+    pixels = np.frombuffer(data, dtype=np.uint8, count=width * height * 3, offset=position + 1)
+    return pixels.reshape(height, width, 3)
+
+def _png_chunk(kind, payload):
+    return struct.pack('>I', len(payload)) + kind + payload + struct.pack('>I', zlib.crc32(kind + payload) & 0xffffffff)
+
+def write_png(path, pixels, dpi=None):
+    """Write an (height, width, 3 or 4) uint8 array as a PNG, recording the resolution like cmd.png(dpi=...)."""
+    pixels = np.ascontiguousarray(pixels, dtype=np.uint8)
+    height, width, channels = pixels.shape
+    color_type = {3: 2, 4: 6}[channels]
+
+    # Each scanline is prefixed with filter type 0 (none)
+    scanlines = np.zeros((height, width * channels + 1), dtype=np.uint8)
+    scanlines[:, 1:] = pixels.reshape(height, width * channels)
+
+    chunks = [_png_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, color_type, 0, 0, 0))]
+    if dpi:
+        pixels_per_meter = int(round(dpi / 0.0254))
+        chunks.append(_png_chunk(b'pHYs', struct.pack('>IIB', pixels_per_meter, pixels_per_meter, 1)))
+    chunks.append(_png_chunk(b'IDAT', zlib.compress(scanlines.tobytes(), 6)))
+    chunks.append(_png_chunk(b'IEND', b''))
+
+    with open(path, 'wb') as handle:
+        handle.write(b'\x89PNG\r\n\x1a\n' + b''.join(chunks))
+
+def read_png(path):
+    """Read an 8-bit, non-interlaced PNG (as written by cmd.png) into an (height, width, channels) uint8 array."""
+    with open(path, 'rb') as handle:
+        data = handle.read()
+    if data[:8] != b'\x89PNG\r\n\x1a\n':
+        raise ValueError(f"{path} is not a PNG file.")
+
+    position, idat = 8, []
+    while position < len(data):
+        length, kind = struct.unpack('>I4s', data[position:position + 8])
+        payload = data[position + 8:position + 8 + length]
+        if kind == b'IHDR':
+            width, height, bit_depth, color_type, _, _, interlace = struct.unpack('>IIBBBBB', payload)
+        elif kind == b'IDAT':
+            idat.append(payload)
+        elif kind == b'IEND':
+            break
+        position += length + 12
+    channels = {0: 1, 2: 3, 4: 2, 6: 4}.get(color_type)
+    if bit_depth != 8 or interlace or channels is None:
+        raise ValueError(f"{path}: only 8-bit non-interlaced grey/RGB/RGBA PNG files are supported.")
+
+    stride = width * channels
+    raw = np.frombuffer(zlib.decompress(b''.join(idat)), dtype=np.uint8).reshape(height, stride + 1)
+    pixels = np.zeros((height, stride), dtype=np.uint8)
+    previous = np.zeros(stride, dtype=np.uint8)
+    for y in range(height):
+        filter_type, line = raw[y, 0], raw[y, 1:]
+        if filter_type == 0:
+            row = line.copy()
+        elif filter_type == 1:
+            # Sub: a running sum of each channel along the row, modulo 256
+            row = np.cumsum(line.reshape(width, channels), axis=0, dtype=np.uint8).reshape(stride)
+        elif filter_type == 2:
+            row = line + previous
+        else:
+            # Average and Paeth depend on the reconstructed pixel to the left, so they run byte by byte
+            row, line_bytes, above = [0] * stride, line.tolist(), previous.tolist()
+            for i in range(stride):
+                left = row[i - channels] if i >= channels else 0
+                if filter_type == 3:
+                    predictor = (left + above[i]) >> 1
+                else:
+                    upper_left = above[i - channels] if i >= channels else 0
+                    estimate = left + above[i] - upper_left
+                    distance_left, distance_above = abs(estimate - left), abs(estimate - above[i])
+                    distance_upper_left = abs(estimate - upper_left)
+                    if distance_left <= distance_above and distance_left <= distance_upper_left:
+                        predictor = left
+                    elif distance_above <= distance_upper_left:
+                        predictor = above[i]
+                    else:
+                        predictor = upper_left
+                row[i] = (line_bytes[i] + predictor) & 0xff
+            row = np.asarray(row, dtype=np.uint8)
+        pixels[y] = row
+        previous = row
+    return pixels.reshape(height, width, channels)
+
+# ---------------------------------------------------
+# Worker Processes
+# ---------------------------------------------------
+
+_worker_pymol = None
+
+def _init_worker(session_path):
+    """Start a private PyMOL instance in the worker and load the shared scene once."""
+    global _worker_pymol
+    import pymol2
+
+    _worker_pymol = pymol2.PyMOL()
+    _worker_pymol.start()
+    _worker_pymol.cmd.load(session_path)
+    _worker_pymol.cmd.set('max_threads', 1)
+
+def _render_tile(view, fov, width, height, ppm_path):
+    cmd = _worker_pymol.cmd
+    cmd.set_view(view)
+    cmd.set('orthoscopic', 1)
+    cmd.set('field_of_view', fov)
+    cmd.png(ppm_path, width=width, height=height, ray=1, quiet=1, format=1)
+    return ppm_path
+
+# ---------------------------------------------------
+# Tiled Rendering
+# ---------------------------------------------------
+
+class TiledRenderer:
+    """A pool of tile workers sharing one saved copy of the current scene, for several images of that scene.
+
+    Starting the workers (importing PyMOL and loading the scene in each) is paid once per scene rather than once
+    per image, so the side and top views of a sequence share it. Only the view may change between renders.
+    Example:
+        with TiledRenderer(tiles=8) as renderer:
+            renderer.render('/path/to/side.png', dpi=300)
+            cmd.set_view(top_view)
+            renderer.render('/path/to/top.png', dpi=300)
+    """
+
+    def __init__(self, tiles=None, workers=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.tiles = tiles or self.workers * TILES_PER_WORKER
+        self._scratch = None
+        self._pool = None
+        self._images = 0
+
+    def __enter__(self):
+        from pymol import cmd
+
+        self._scratch = tempfile.TemporaryDirectory(prefix='tiled_render_')
+        session_path = os.path.join(self._scratch.name, 'scene.pse')
+        cmd.save(session_path)
+        self._pool = ProcessPoolExecutor(max_workers=min(self.workers, self.tiles), mp_context=get_context('spawn'),
+                                         initializer=_init_worker, initargs=(session_path,))
+        return self
+
+    def __exit__(self, *exc_info):
+        self._pool.shutdown()
+        self._scratch.cleanup()
+
+    def render(self, full_path, width=None, height=None, dpi=300):
+        """Ray trace the current view of the scene as parallel horizontal strips and stitch them into one PNG."""
+        from pymol import cmd
+
+        if not width or not height:
+            width, height = cmd.get_viewport()
+
+        view = list(cmd.get_view())
+        if view[17] < 0:
+            print("Tiled rendering uses an orthoscopic projection; perspective views are rendered orthoscopic.")
+
+        self._images += 1
+        jobs = []
+        for index, (row_start, row_stop) in enumerate(split_extent(height, self.tiles)):
+            strip_view, strip_fov = tile_view(view, width, height, row_start, row_stop)
+            jobs.append((strip_view, strip_fov, width, row_stop - row_start,
+                         os.path.join(self._scratch.name, f'image_{self._images:03d}_tile_{index:03d}.ppm')))
+        ppm_paths = list(self._pool.map(_render_tile, *zip(*jobs)))
+
+        image = np.concatenate([read_ppm(path) for path in ppm_paths], axis=0)
+        for path in ppm_paths:
+            os.remove(path)
+        if image.shape[:2] != (height, width):
+            raise RuntimeError(f"Stitched image is {image.shape[1]}x{image.shape[0]}, expected {width}x{height}.")
+
+        # cmd.png() writes RGBA; an opaque alpha channel keeps tiled images in the same format
+        alpha = np.full(image.shape[:2] + (1,), 255, dtype=np.uint8)
+        write_png(full_path, np.concatenate([image, alpha], axis=2), dpi=dpi)
+        return full_path
+
+
+def render_tiled(full_path, tiles=None, workers=None, width=None, height=None, dpi=300):
+    """Ray trace the current scene as parallel horizontal strips and stitch them into one PNG."""
+    with TiledRenderer(tiles=tiles, workers=workers) as renderer:
+        return renderer.render(full_path, width=width, height=height, dpi=dpi)
+
+# ---------------------------------------------------
+# Benchmark
+# ---------------------------------------------------
+
+def benchmark(strain_type='H3N2', workers_list=(1, 2, 4, 8), width=2400, height=1800):
+    """Time the side and top views of a bundled structure untiled and tiled; returns {workers: seconds}."""
+    import time
+
+    import Pymol_mark_mutations
+    from pymol import cmd
+
+    protein = Pymol_mark_mutations.load_structure(strain_type)
+    Pymol_mark_mutations.apply_style(strain_type, *{'H1N1': ('5a.2a', 'C.1'), 'H3N2': ('2b', 'G.2')}[strain_type])
+    cmd.viewport(width, height)
+
+    timings = {}
+    with tempfile.TemporaryDirectory(prefix='tiled_benchmark_') as scratch:
+        start = time.perf_counter()
+        Pymol_mark_mutations.export_images('benchmark', protein, 'untiled', None, output_location=scratch,
+                                           output_archive=False)
+        timings[0] = time.perf_counter() - start
+        for workers in workers_list:
+            start = time.perf_counter()
+            with TiledRenderer(tiles=workers * TILES_PER_WORKER, workers=workers) as renderer:
+                Pymol_mark_mutations.export_images('benchmark', protein, 'tiled', None, output_location=scratch,
+                                                   tiles=renderer.tiles, output_archive=False, renderer=renderer)
+            timings[workers] = time.perf_counter() - start
+
+    print(f"{'workers':>8} {'seconds':>8} {'speedup':>8}   (side + top, {width}x{height}, worker startup included)")
+    print(f"{'untiled':>8} {timings[0]:>8.1f} {1.0:>8.2f}")
+    for workers in workers_list:
+        print(f"{workers:>8} {timings[workers]:>8.1f} {timings[0] / timings[workers]:>8.2f}")
+    return timings
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='tiled_render', description="Measure the speedup of tiled rendering.")
+    parser.add_argument('command', choices=['benchmark'])
+    parser.add_argument('--strain-type', default='H3N2', choices=['H1N1', 'H3N2'])
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    args = parser.parse_args()
+    benchmark(args.strain_type, args.workers)